@@ -0,0 +1,227 @@
+"""
+Local fakes of the external services, for exercising the pipeline without
+network access or API keys.
+"""
+import re
+import json
+import time
+import uuid
+import random
+import datetime
+from types import SimpleNamespace
+
+import httpx
+import jwt
+
+from fmp_client import FMPClient
+
+
+class FakeGhostAdminAPI:
+    """
+    In-memory Ghost Admin API for httpx.MockTransport:
+
+        transport = httpx.MockTransport(FakeGhostAdminAPI(admin_key))
+        AsyncGhostClient("https://ghost.local", admin_key, transport=transport)
+
+    Verifies the JWT, stores posts and uploaded images, and enforces Ghost's
+    `updated_at` collision check on updates.
+    """
+
+    def __init__(self, admin_key: str, base_url: str = "https://ghost.local"):
+        self.key_id, secret = admin_key.split(':')
+        self.secret = bytes.fromhex(secret)
+        self.base_url = base_url
+        self.posts = {}
+        self.images = []
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append((request.method, request.url.path))
+        auth = request.headers.get('Authorization', '')
+        try:
+            token = auth.removeprefix('Ghost ')
+            if jwt.get_unverified_header(token).get('kid') != self.key_id:
+                raise jwt.InvalidTokenError("unknown kid")
+            jwt.decode(token, self.secret, algorithms=['HS256'], audience='/admin/')
+        except jwt.PyJWTError as e:
+            return self._error(401, f"Invalid token: {e}")
+
+        path = request.url.path.removeprefix('/ghost/api/admin')
+        if request.method == 'POST' and path == '/images/upload/':
+            return self._upload_image(request)
+        if request.method == 'POST' and path == '/posts/':
+            return self._create_post(json.loads(request.content)['posts'][0])
+
+        match = re.fullmatch(r'/posts/slug/([^/]+)/', path)
+        if request.method == 'GET' and match:
+            post = next((p for p in self.posts.values() if p['slug'] == match.group(1)), None)
+            return self._posts(post) if post else self._error(404, "Post not found")
+
+        match = re.fullmatch(r'/posts/([^/]+)/', path)
+        if match:
+            post = self.posts.get(match.group(1))
+            if post is None:
+                return self._error(404, "Post not found")
+            if request.method == 'GET':
+                return self._posts(post)
+            if request.method == 'PUT':
+                return self._update_post(post, json.loads(request.content)['posts'][0])
+
+        return self._error(404, f"No route for {request.method} {path}")
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='microseconds')
+
+    @staticmethod
+    def _error(status: int, message: str) -> httpx.Response:
+        return httpx.Response(status, json={'errors': [{'message': message}]})
+
+    @staticmethod
+    def _posts(post: dict, status: int = 200) -> httpx.Response:
+        return httpx.Response(status, json={'posts': [post]})
+
+    def _upload_image(self, request: httpx.Request) -> httpx.Response:
+        match = re.search(rb'filename="([^"]+)"', request.content)
+        name = match.group(1).decode() if match else f"{uuid.uuid4().hex}.png"
+        url = f"{self.base_url}/content/images/{len(self.images)}/{name}"
+        self.images.append(url)
+        return httpx.Response(201, json={'images': [{'url': url, 'ref': name}]})
+
+    def _create_post(self, data: dict) -> httpx.Response:
+        slug = data.get('slug') or re.sub(r'\W+', '-', data.get('title', '')).strip('-').lower() or uuid.uuid4().hex
+        if any(p['slug'] == slug for p in self.posts.values()):
+            slug = f"{slug}-2"
+        post = {**data, 'id': uuid.uuid4().hex, 'slug': slug, 'status': data.get('status', 'draft'), 'updated_at': self._now()}
+        self.posts[post['id']] = post
+        return self._posts(post, 201)
+
+    def _update_post(self, post: dict, data: dict) -> httpx.Response:
+        if data.get('updated_at') != post['updated_at']:
+            return self._error(409, "Saving failed! Someone else is editing this post.")
+        post.update({k: v for k, v in data.items() if k != 'updated_at'})
+        post['updated_at'] = self._now()
+        return self._posts(post)
+
+
+FAKE_RECAP = (
+    "Stocks finished higher as investors weighed fresh inflation data.\n\n"
+    "Bond yields slipped while energy shares lagged on lower crude prices.\n\n"
+    "Technology led the advance with semiconductor names outperforming."
+)
+
+
+async def fake_market_recap_content() -> str:
+    return FAKE_RECAP
+
+
+class FakeFMPClient(FMPClient):
+    """
+    FMPClient whose HTTP layer returns deterministic canned data, so the real
+    parsing, movers ranking, news dedup and summarization paths still run.
+    """
+
+    def __init__(self, seed: int = 0):
+        super().__init__(api_key="fake")
+        self.seed = seed
+        self.request_count = 0
+
+    def _quote(self, symbol: str) -> dict:
+        rng = random.Random(f"{self.seed}:{symbol}")
+        return {'symbol': symbol, 'price': round(rng.uniform(10, 500), 2), 'changesPercentage': round(rng.uniform(-6, 6), 2)}
+
+    def _news(self, symbol: str) -> list[dict]:
+        now = datetime.datetime.now().replace(minute=0, second=0, microsecond=0)
+        earlier = (now - datetime.timedelta(hours=3)).strftime("%Y-%m-%d %H:%M:%S")
+        now = now.strftime("%Y-%m-%d %H:%M:%S")
+        wire = f"{symbol} shares moved sharply after the company reported quarterly results and updated its outlook for the year."
+        # 同一則通訊社稿被不同媒體轉載
+        return [
+            {'symbol': symbol, 'title': f"{symbol} reports results", 'text': wire, 'publishedDate': now},
+            {'symbol': symbol, 'title': f"{symbol} reports results", 'text': wire, 'publishedDate': earlier},
+            {'symbol': symbol, 'title': f"Analysts on {symbol}", 'text': f"Analysts revised price targets on {symbol} following the move.", 'publishedDate': now},
+        ]
+
+    def _request(self, endpoint: str, params: dict = None):
+        self.request_count += 1
+        if endpoint.startswith("api/v3/quote/"):
+            return [self._quote(s) for s in endpoint.removeprefix("api/v3/quote/").split(",")]
+        if endpoint in ("stable/news/stock", "api/v3/stock_news"):
+            return self._news(params['symbols'])
+        return None
+
+    def probe(self) -> dict:
+        return {'ok': True, 'status': 200, 'remaining': None}
+
+    def get_treasury_rates(self):
+        return {
+            tenor: {'current': base, 'prev': base + 0.02, '5d': base + 0.05, 'lm': base - 0.1}
+            for tenor, base in (("US 2Y", 3.5), ("US 10Y", 4.1), ("US 30Y", 4.6))
+        }
+
+
+class _FakeModels:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if "JSON 列表中的每一段文字翻譯成" in contents:
+            language = re.search(r"翻譯成「(.+?)」", contents).group(1)
+            texts = json.loads(contents[contents.index("原文：") + 3:].strip())
+            text = json.dumps([f"[{language}] {t}" for t in texts], ensure_ascii=False)
+        elif config is not None and getattr(config, 'response_mime_type', None) == "application/json":
+            text = json.dumps([{'topic': "股市表現", 'summary': "美股收高，科技股領漲。"}], ensure_ascii=False)
+        elif "[本次僅更新單一區塊]" in contents:
+            # 增量渲染的單一區塊：回傳 prompt 中的區塊版型
+            start = re.search(r"<!--\s*\d+\.", contents).start()
+            text = contents[start:contents.index("### [本次僅更新單一區塊]")].strip()
+        elif "<html" in contents:
+            # HTML 生成階段：直接回傳 prompt 中的版型
+            text = contents[contents.index("<!DOCTYPE") if "<!DOCTYPE" in contents else contents.index("<html"):]
+        else:
+            text = "公司公布季度財報並更新全年展望。"
+        usage = SimpleNamespace(prompt_token_count=len(contents) // 4, candidates_token_count=len(text) // 4)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    def count_tokens(self, model, contents):
+        return SimpleNamespace(total_tokens=len(contents) // 4)
+
+
+class FakeGenaiClient:
+    """Stand-in for genai.Client exposing `models.generate_content` / `models.count_tokens`."""
+
+    def __init__(self, latency: float = 0):
+        self.models = _FakeModels(latency)
+
+
+class FakeBot:
+    """Stand-in for telegram.Bot; reads the uploaded files and counts messages."""
+
+    sent = 0
+
+    def __init__(self, token: str = None):
+        self.token = token
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def __aenter__(self):
+        await self.initialize()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.shutdown()
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        photo.read()
+        FakeBot.sent += 1
+
+    async def send_message(self, chat_id, text, **kwargs):
+        FakeBot.sent += 1
@@ -7,6 +7,7 @@ from collections import Counter
 from pathlib import Path
 from datetime import datetime, date, timedelta
 from generate import summarize_company_news
+from news_dedup import dedup_news
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +19,8 @@ class FMPClient:
             raise ValueError("FMP API key is required.")
         self.api_key = api_key
         self.base_url = "https://financialmodelingprep.com"
+        self.session = requests.Session()
+        self._sp500_symbols = None  # (mtime, symbols)
 
     def _request(self, endpoint: str, params: dict = None) -> Optional[dict]:
         if params is None:
@@ -25,7 +28,7 @@ class FMPClient:
         params['apikey'] = self.api_key
         url = f"{self.base_url}/{endpoint}"
         try:
-            response = requests.get(url, params=params)
+            response = self.session.get(url, params=params)
             response.raise_for_status()
             data = response.json()
             if not data:
@@ -36,6 +39,40 @@ class FMPClient:
             logger.error(f"Error fetching from {url}: {e}")
             return None
     
+    def probe(self) -> dict:
+        """
+        Issue one cheap quote request to open the pooled TLS connection and
+        report quota headroom (HTTP status and rate-limit headers, if any).
+        """
+        url = f"{self.base_url}/api/v3/quote-short/SPY"
+        try:
+            response = self.session.get(url, params={'apikey': self.api_key}, timeout=30)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"FMP probe failed: {e}")
+            return {'ok': False, 'status': None, 'remaining': None}
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        return {
+            'ok': response.status_code == 200,
+            'status': response.status_code,
+            'remaining': int(remaining) if remaining and remaining.isdigit() else None,
+        }
+
+    def load_sp500_symbols(self) -> list[str]:
+        """
+        Read the constituent universe from resource/sp500_stock.xlsx, cached until
+        the file's modification time changes.
+        """
+        path = BASE_DIR / "resource/sp500_stock.xlsx"
+        mtime = path.stat().st_mtime_ns
+        if self._sp500_symbols is None or self._sp500_symbols[0] != mtime:
+            sp500_df = pd.read_excel(path)
+            if 'Symbol' in sp500_df.columns:
+                symbols = sp500_df['Symbol'].astype(str).tolist()
+            else:
+                symbols = sp500_df.iloc[:, 0].astype(str).tolist()
+            self._sp500_symbols = (mtime, symbols)
+        return self._sp500_symbols[1]
+
     def get_sp500(self):
         endpoint = "api/v3/sp500_constituent"
         sp500_data = self._request(endpoint)
@@ -48,6 +85,23 @@ class FMPClient:
         change_rate = price_data[0]['changesPercentage']
         return price, change_rate
     
+    def get_weekly_change(self, symbol: str):
+        """
+        Latest close and its % change versus the last close at least 7 calendar days earlier.
+        """
+        endpoint = f"api/v3/historical-price-full/{symbol}"
+        data = self._request(endpoint, params={'timeseries': 10})
+        historical = data.get('historical') if data else None
+        if not historical:
+            return None, None
+        latest = historical[0]
+        latest_date = datetime.strptime(latest['date'], "%Y-%m-%d").date()
+        for row in historical[1:]:
+            if datetime.strptime(row['date'], "%Y-%m-%d").date() <= latest_date - timedelta(days=7):
+                change = (latest['close'] / row['close'] - 1) * 100
+                return latest['close'], round(change, 2)
+        return latest['close'], None
+
     def get_treasury_rates(self):
         excel_file = BASE_DIR / "resource/treasury.xlsx"
         endpoint = "stable/treasury-rates"
@@ -118,48 +172,49 @@ class FMPClient:
         }
         return result
 
-    def get_biggest_change_sp500_stock(self):
-        endpoint = "api/v3/quote-short"
-        try:
-            sp500_df = pd.read_excel(BASE_DIR / "resource/sp500_stock.xlsx")
-            if 'Symbol' in sp500_df.columns:
-                sp500_symbols = sp500_df['Symbol'].astype(str).tolist()
-            else:
-                sp500_symbols = sp500_df.iloc[:, 0].astype(str).tolist()
-            all_quotes = []
-            
-            for i in range(0, len(sp500_symbols), 500):
-                chunk = sp500_symbols[i:i + 500]
-                symbols_string = ",".join(chunk)
-                batch_endpoint = f"api/v3/quote/{symbols_string}"
-                data = self._request(batch_endpoint)
-                if data:
-                    all_quotes.extend(data)
-            if not all_quotes:
-                return []
-            valid_quotes = [q for q in all_quotes if q.get('changesPercentage') is not None]
-            sorted_quotes = sorted(valid_quotes, key=lambda x: x['changesPercentage'], reverse=True)
-            top_6 = sorted_quotes[:6]
-            bottom_6 = sorted_quotes[-6:]
-            result_list = []
-            
-            for item in top_6:
-                result_list.append({
-                    'symbol': item.get('symbol'),
-                    'changesPercentage': item.get('changesPercentage'),
-                    'price': item.get('price'),
-                    'type': 'Top Gainer'
-                })
-                
-            for item in bottom_6:
+    def get_batch_quotes(self, symbols: list[str], chunk_size: int = 500) -> list[dict]:
+        """Full quotes for many symbols via comma-joined api/v3/quote/ requests."""
+        all_quotes = []
+        for i in range(0, len(symbols), chunk_size):
+            chunk = symbols[i:i + chunk_size]
+            symbols_string = ",".join(chunk)
+            batch_endpoint = f"api/v3/quote/{symbols_string}"
+            data = self._request(batch_endpoint)
+            if data:
+                all_quotes.extend(data)
+        return all_quotes
+
+    def get_sp500_quotes(self) -> list[dict]:
+        """Batch quotes for every S&P 500 constituent that has a change percentage."""
+        sp500_symbols = self.load_sp500_symbols()
+        all_quotes = self.get_batch_quotes(sp500_symbols)
+        return [q for q in all_quotes if q.get('changesPercentage') is not None]
+
+    @staticmethod
+    def rank_movers(quotes: list[dict], count: int = 6) -> list[dict]:
+        """Top `count` gainers and bottom `count` losers of `quotes` (no symbol listed twice)."""
+        sorted_quotes = sorted(quotes, key=lambda x: x['changesPercentage'], reverse=True)
+        top = sorted_quotes[:count]
+        bottom = sorted_quotes[max(count, len(sorted_quotes) - count):]
+        result_list = []
+
+        for label, items in (('Top Gainer', top), ('Top Loser', bottom)):
+            for item in items:
                 result_list.append({
                     'symbol': item.get('symbol'),
                     'changesPercentage': item.get('changesPercentage'),
                     'price': item.get('price'),
-                    'type': 'Top Loser'
+                    'type': label
                 })
-                
-            return result_list
+
+        return result_list
+
+    def get_biggest_change_sp500_stock(self):
+        try:
+            valid_quotes = self.get_sp500_quotes()
+            if not valid_quotes:
+                return []
+            return self.rank_movers(valid_quotes)
 
         except Exception as e:
             logger.error(f"Error processing S&P 500 stock data: {e}")
@@ -173,13 +228,8 @@ class FMPClient:
         top_3_symbols = [symbol for symbol, num in count.most_common(3)]
         return top_3_symbols
     
-    def get_symbol_news(self, symbols: list[str]):
-        today = date.today()
-        yesterday = today - timedelta(days=1)
+    def _fetch_recent_news(self, endpoint: str, symbols: list[str], since: date) -> dict[str, list[dict]]:
         results = {}
-        
-        endpoint = "api/v3/stock_news"
-        
         for symbol in symbols:
             params = {'symbols': symbol}
             news_data = self._request(endpoint, params=params)
@@ -195,7 +245,7 @@ class FMPClient:
                         pub_datetime = datetime.strptime(pub_date_str, "%Y-%m-%d %H:%M:%S")
                         pub_date = pub_datetime.date()
                         
-                        if pub_date >= yesterday:
+                        if pub_date >= since:
                             symbol_news_items.append({
                                 'title': news.get('title'),
                                 'text': news.get('text'),
@@ -203,43 +253,33 @@ class FMPClient:
                             })
                     except (ValueError, TypeError):
                         continue
-            
-            summary = summarize_company_news(symbol, symbol_news_items)
-            results[symbol] = summary
-            
+            results[symbol] = symbol_news_items
         return results
 
+    def _dedup_news(self, news_by_symbol: dict[str, list[dict]]) -> dict[str, list[dict]]:
+        news_by_symbol, stats = dedup_news(news_by_symbol)
+        logger.info(
+            f"News dedup: {stats['articles_in']} -> {stats['articles_out']} articles, "
+            f"removed {stats['removed']} ({stats['chars_removed']} chars) in {stats['seconds']}s"
+        )
+        print(f"   - 新聞去重: {stats['articles_in']} → {stats['articles_out']} 篇，移除 {stats['removed']} 篇 / {stats['chars_removed']} 字元 ({stats['seconds']}s)")
+        return news_by_symbol
+
+    def _summarize_news(self, news_by_symbol: dict[str, list[dict]]) -> dict[str, str]:
+        news_by_symbol = self._dedup_news(news_by_symbol)
+        return {symbol: summarize_company_news(symbol, items) for symbol, items in news_by_symbol.items()}
+
+    def get_symbol_news(self, symbols: list[str]):
+        yesterday = date.today() - timedelta(days=1)
+        news_by_symbol = self._fetch_recent_news("api/v3/stock_news", symbols, since=yesterday)
+        return self._summarize_news(news_by_symbol)
+
+    def get_sp500_change_news_items(self, symbols: list[str]) -> dict[str, list[dict]]:
+        """Deduplicated recent articles per symbol, before summarization (incremental mode fingerprints these)."""
+        befor_yesterday = date.today() - timedelta(days=2)
+        news_by_symbol = self._fetch_recent_news("stable/news/stock", symbols, since=befor_yesterday)
+        return self._dedup_news(news_by_symbol)
+
     def get_sp500_change_news(self, symbols: list[str]):
-        today = date.today()
-        befor_yesterday = today - timedelta(days=2)
-        results = {}
-        
-        endpoint = "stable/news/stock"
-        for symbol in symbols:
-            params = {'symbols': symbol}
-            news_data = self._request(endpoint, params=params)
-            
-            symbol_news_items = []
-            if news_data:
-                for news in news_data:
-                    pub_date_str = news.get('publishedDate')
-                    if not pub_date_str:
-                        continue
-                        
-                    try:
-                        pub_datetime = datetime.strptime(pub_date_str, "%Y-%m-%d %H:%M:%S")
-                        pub_date = pub_datetime.date()
-                        
-                        if pub_date >= befor_yesterday:
-                            symbol_news_items.append({
-                                'title': news.get('title'),
-                                'text': news.get('text'),
-                                'publishedDate': pub_date_str,
-                            })
-                    except (ValueError, TypeError):
-                        continue
-            
-            summary = summarize_company_news(symbol, symbol_news_items)
-            results[symbol] = summary
-            
-        return results
+        news_by_symbol = self.get_sp500_change_news_items(symbols)
+        return {symbol: summarize_company_news(symbol, items) for symbol, items in news_by_symbol.items()}
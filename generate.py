@@ -1,23 +1,132 @@
 import os
+import json
+import time
+from pathlib import Path
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
+from prompt_payload import FIELD_BUDGETS, compact_json, estimate_tokens, format_news_items, truncate
+from llm_hedge import (
+    LatencyStats, DeadlineExceeded, current_deadline, hedged_call,
+    is_non_empty, is_valid_html, is_valid_json, strip_code_fence,
+)
 
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 client = genai.Client(api_key=GEMINI_API_KEY)
 MODEL_NAME = "gemini-3-flash-preview"
+# 備援模型 (依序)：主模型超過其 p95 延遲仍未回應時，同時送出備援請求，先回傳有效結果者勝出
+FALLBACK_MODELS = [m.strip() for m in os.getenv("GEMINI_FALLBACK_MODELS", "gemini-2.5-flash").split(",") if m.strip()]
+MODEL_TIERS = [MODEL_NAME] + [m for m in FALLBACK_MODELS if m != MODEL_NAME]
+
+# 各模型/階段的延遲分佈 (決定啟動備援的門檻)，跨執行保存
+LATENCY_STATS = LatencyStats(os.getenv("LLM_LATENCY_STATS", Path(__file__).resolve().parent / "state/llm_latency.json"))
+
+# 樣本不足時各階段的預設備援門檻 (秒) 與回應驗證方式
+STAGE_HEDGE_DEFAULTS = {
+    'market_analysis': 90,
+    'company_news': 15,
+    'market_recap': 30,
+    'tg_html': 120,
+    'email_html': 120,
+    'html_section': 45,
+    'translate': 30,
+}
+STAGE_VALIDATORS = {
+    'market_recap': is_valid_json,
+    'translate': is_valid_json,
+    'tg_html': is_valid_html,
+    'email_html': is_valid_html,
+}
+
+# 各階段 prompt 的估計 token 上限 (超過會警告)
+STAGE_TOKEN_CAPS = {
+    'market_analysis': 8000,
+    'company_news': 4000,
+    'market_recap': 8000,
+    'tg_html': 24000,
+    'email_html': 24000,
+    'html_section': 8000,
+    'translate': 8000,
+}
+
+# 摘要失敗時的回傳開頭 (增量模式不沿用這類摘要)
+SUMMARY_ERROR_PREFIX = "生成總結時發生錯誤"
+
+# 每次呼叫的 token 紀錄 (stage, model, 估計輸入, 實際輸入, 實際輸出, 秒數)
+TOKEN_LEDGER = []
+
+def _with_timeout(config, timeout):
+    """在 config 上設定 HTTP timeout (毫秒)，確保被放棄的請求不會無限期佔用執行緒"""
+    http_options = types.HttpOptions(timeout=max(1000, int(timeout * 1000)))
+    if config is None:
+        return types.GenerateContentConfig(http_options=http_options)
+    return config.model_copy(update={'http_options': http_options})
+
+def generate_content(stage: str, contents: str, config=None, models: list[str] = None):
+    """
+    呼叫 Gemini 並記錄該階段的估計與實際 token 數。
+    超過 STAGE_TOKEN_CAPS 時發出警告 (prompt 應由各欄位預算控制在上限內)。
+    依目前的 deadline (llm_hedge.deadline_scope) 限制等待時間，並以 MODEL_TIERS 進行對沖請求。
+    """
+    estimated = estimate_tokens(contents)
+    cap = STAGE_TOKEN_CAPS.get(stage)
+    if cap and estimated > cap:
+        print(f"[!] [{stage}] prompt 估計 {estimated} tokens，超過上限 {cap}")
+
+    deadline = current_deadline()
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceeded(f"{stage}: run deadline already passed")
+
+    def call(model, timeout):
+        call_config = _with_timeout(config, timeout) if timeout is not None else config
+        return client.models.generate_content(model=model, contents=contents, config=call_config)
+
+    started = time.monotonic()
+    model, response = hedged_call(
+        call,
+        models or MODEL_TIERS,
+        stage,
+        LATENCY_STATS,
+        validate=STAGE_VALIDATORS.get(stage, is_non_empty),
+        hedge_default=STAGE_HEDGE_DEFAULTS.get(stage, 30),
+        deadline=deadline,
+    )
+    elapsed = time.monotonic() - started
+
+    usage = getattr(response, 'usage_metadata', None)
+    record = {
+        'stage': stage,
+        'model': model,
+        'estimated': estimated,
+        'prompt_tokens': getattr(usage, 'prompt_token_count', None),
+        'output_tokens': getattr(usage, 'candidates_token_count', None),
+        'seconds': round(elapsed, 2),
+    }
+    TOKEN_LEDGER.append(record)
+    print(f"   [tokens] {stage}: 估計 {estimated} / 實際輸入 {record['prompt_tokens']} / 輸出 {record['output_tokens']} ({elapsed:.1f}s)")
+    return response
+
+def token_report(reset: bool = True) -> dict:
+    """依階段彙總 TOKEN_LEDGER；reset=True 時清空紀錄 (每次執行結束呼叫)"""
+    summary = {}
+    for record in TOKEN_LEDGER:
+        stage = summary.setdefault(record['stage'], {'calls': 0, 'estimated': 0, 'prompt_tokens': 0, 'output_tokens': 0})
+        stage['calls'] += 1
+        stage['estimated'] += record['estimated']
+        stage['prompt_tokens'] += record['prompt_tokens'] or 0
+        stage['output_tokens'] += record['output_tokens'] or 0
+    if reset:
+        TOKEN_LEDGER.clear()
+        LATENCY_STATS.save()
+    return summary
 
 def summarize_company_news(symbol: str, news_items: list[dict]) -> str:
     if not news_items:
         return "無相關新聞資料。"
 
-    combined_text = ""
-    for item in news_items:
-        title = item.get('title', 'No Title')
-        text = item.get('text', 'No Content')
-        combined_text += f"Title: {title}\nContent: {text}\n---\n"
+    combined_text = format_news_items(news_items)
 
     prompt = f"""
     你是一位專業的金融分析師。請閱讀以下關於 {symbol} 的新聞內容，並將其整理統整。
@@ -29,13 +138,10 @@ def summarize_company_news(symbol: str, news_items: list[dict]) -> str:
     """
 
     try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=prompt
-        )
+        response = generate_content('company_news', prompt)
         return response.text.strip()
     except Exception as e:
-        return f"生成總結時發生錯誤: {e}"
+        return f"{SUMMARY_ERROR_PREFIX}: {e}"
 
 def summarize_market_recap(recap_content: str) -> list[dict]:
     if not recap_content:
@@ -57,19 +163,47 @@ def summarize_market_recap(recap_content: str) -> list[dict]:
     ]
 
     原文內容：
-    {recap_content}
+    {truncate(recap_content, FIELD_BUDGETS['recap_content'])}
     """
 
     try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=prompt,
+        response = generate_content(
+            'market_recap',
+            prompt,
             config=types.GenerateContentConfig(
                 response_mime_type="application/json"
             )
         )
-        import json
         return json.loads(response.text)
     except Exception as e:
         print(f"生成市場回顧總結時發生錯誤: {e}")
         return []
+
+
+def translate_texts(texts: list[str], language: str) -> list[str]:
+    """將多段文字一次翻譯成 language；回傳與輸入等長、順序相同的列表"""
+    if not texts:
+        return []
+
+    prompt = f"""
+    你是一位專業的金融翻譯。請將下方 JSON 列表中的每一段文字翻譯成「{language}」。
+    公司名稱與股票代號保持原文，數字與百分比不可更改，不要加入任何說明。
+
+    **輸出格式要求**：
+    請輸出一個 JSON 字串列表，長度與順序必須與輸入完全相同，不要有 markdown code block。
+
+    原文：
+    {compact_json(texts)}
+    """
+
+    response = generate_content(
+        'translate',
+        prompt,
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json"
+        )
+    )
+    translated = json.loads(strip_code_fence(response.text))
+    if not isinstance(translated, list) or len(translated) != len(texts):
+        raise ValueError(f"翻譯結果數量不符 ({len(texts)} 段)")
+    return [str(t) for t in translated]
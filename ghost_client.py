@@ -1,8 +1,40 @@
 import requests
 import jwt
-import datetime
+import time
+import asyncio
+import mimetypes
 import os
 import json
+from pathlib import Path
+
+import httpx
+
+
+class AdminToken:
+    """
+    Signs Ghost Admin API JWTs and reuses each token until shortly before its `exp`.
+    """
+
+    def __init__(self, admin_key: str, lifetime: int = 300, refresh_margin: int = 30):
+        self.key_id, self.secret = admin_key.split(':')
+        self.lifetime = lifetime
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self._expires_at = 0
+
+    def get(self) -> str:
+        now = int(time.time())
+        if self._token is None or now >= self._expires_at - self.refresh_margin:
+            header = {'alg': 'HS256', 'typ': 'JWT', 'kid': self.key_id}
+            payload = {
+                'iat': now,
+                'exp': now + self.lifetime,
+                'aud': '/admin/'
+            }
+            # Create the token (secret is hex text)
+            self._token = jwt.encode(payload, bytes.fromhex(self.secret), algorithm='HS256', headers=header)
+            self._expires_at = now + self.lifetime
+        return self._token
 
 class GhostClient:
     def __init__(self, url: str, admin_key: str):
@@ -14,25 +46,12 @@ class GhostClient:
         self.url = url.rstrip('/')
         self.admin_key = admin_key
         self.session = requests.Session()
+        self._token = AdminToken(admin_key)
 
     def _get_headers(self):
-        """Generate JWT token and return headers."""
-        id_str, secret = self.admin_key.split(':')
-        
-        # Prepare header and payload
-        iat = int(datetime.datetime.now().timestamp())
-        header = {'alg': 'HS256', 'typ': 'JWT', 'kid': id_str}
-        payload = {
-            'iat': iat,
-            'exp': iat + 300,  # 5 minutes
-            'aud': '/admin/'
-        }
-
-        # Create the token (secret is hex text)
-        token = jwt.encode(payload, bytes.fromhex(secret), algorithm='HS256', headers=header)
-
+        """Return headers with a cached JWT token (re-signed shortly before it expires)."""
         return {
-            'Authorization': f'Ghost {token}'
+            'Authorization': f'Ghost {self._token.get()}'
         }
 
     def create_post(self, title: str, html_content: str, status: str = 'published', tags: list = None, codeinjection_head: str = None, codeinjection_foot: str = None):
@@ -74,3 +93,123 @@ class GhostClient:
             if hasattr(e, 'response') and e.response is not None:
                 print(f"    Response: {e.response.text}")
             return None
+
+
+class GhostAPIError(Exception):
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"Ghost API returned {status_code}: {body[:500]}")
+        self.status_code = status_code
+        self.body = body
+
+
+class AsyncGhostClient:
+    """
+    Async Ghost Admin API client with a pooled httpx session and a cached JWT.
+
+    Use as an async context manager. Pass `transport` (e.g. httpx.MockTransport
+    wrapping fakes.FakeGhostAdminAPI) to run against a local fake.
+    """
+
+    def __init__(self, url: str, admin_key: str, transport: httpx.AsyncBaseTransport = None,
+                 timeout: float = 60, max_concurrency: int = 4):
+        """
+        :param url: Ghost Blog URL (e.g., https://your-blog.ghost.io)
+        :param admin_key: Ghost Admin API Key
+        :param max_concurrency: maximum in-flight requests for batch operations
+        """
+        self.url = url.rstrip('/')
+        self.api_url = f"{self.url}/ghost/api/admin"
+        self._token = AdminToken(admin_key)
+        self._client = httpx.AsyncClient(timeout=timeout, transport=transport)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self._client.aclose()
+
+    async def _request(self, method: str, path: str, **kwargs) -> dict:
+        headers = {'Authorization': f'Ghost {self._token.get()}'}
+        async with self._semaphore:
+            response = await self._client.request(method, f"{self.api_url}{path}", headers=headers, **kwargs)
+        if response.status_code >= 400:
+            raise GhostAPIError(response.status_code, response.text)
+        return response.json() if response.content else {}
+
+    async def upload_image(self, path, ref: str = None) -> str:
+        """Upload an image file and return its CDN URL."""
+        path = Path(path)
+        content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        files = {'file': (path.name, path.read_bytes(), content_type)}
+        data = {'purpose': 'image', 'ref': ref or path.name}
+        result = await self._request('POST', '/images/upload/', files=files, data=data)
+        return result['images'][0]['url']
+
+    async def upload_images(self, paths) -> list[str]:
+        return list(await asyncio.gather(*(self.upload_image(p) for p in paths)))
+
+    async def get_post_by_slug(self, slug: str):
+        try:
+            result = await self._request('GET', f'/posts/slug/{slug}/')
+        except GhostAPIError as e:
+            if e.status_code == 404:
+                return None
+            raise
+        return result['posts'][0]
+
+    async def create_post(self, post: dict) -> dict:
+        result = await self._request('POST', '/posts/', params={'source': 'html'}, json={'posts': [post]})
+        return result['posts'][0]
+
+    async def update_post(self, post_id: str, fields: dict, updated_at: str = None) -> dict:
+        """Update a post; Ghost requires the current `updated_at` for collision detection."""
+        if updated_at is None:
+            current = await self._request('GET', f'/posts/{post_id}/')
+            updated_at = current['posts'][0]['updated_at']
+        body = {'posts': [{**fields, 'updated_at': updated_at}]}
+        result = await self._request('PUT', f'/posts/{post_id}/', params={'source': 'html'}, json=body)
+        return result['posts'][0]
+
+    async def upsert_post(self, slug: str, title: str, html_content: str, status: str = 'draft',
+                          overwrite_published: bool = False, **fields) -> dict:
+        """
+        Create the post with this slug, or update it if it already exists, so re-running
+        a report for the same date never creates duplicates.
+        `status` only applies when the post is created; an update never changes it.
+        A post that is already published is left untouched (and returned as is)
+        unless `overwrite_published` is set.
+        """
+        post = {'title': title, 'html': html_content, **fields}
+        existing = await self.get_post_by_slug(slug)
+        if existing is None:
+            return await self.create_post({**post, 'status': status, 'slug': slug})
+        if existing.get('status') == 'published' and not overwrite_published:
+            return existing
+        return await self.update_post(existing['id'], post, updated_at=existing['updated_at'])
+
+    async def batch_update(self, updates: list[dict]) -> list:
+        """
+        Apply several updates concurrently. Each item is {'id': ..., <fields>}.
+        Returns the updated posts, or the exception for items that failed.
+        """
+        async def one(update):
+            fields = {k: v for k, v in update.items() if k not in ('id', 'updated_at')}
+            return await self.update_post(update['id'], fields, updated_at=update.get('updated_at'))
+
+        return list(await asyncio.gather(*(one(u) for u in updates), return_exceptions=True))
+
+    async def publish_many(self, post_ids: list[str]) -> list:
+        return await self.batch_update([{'id': post_id, 'status': 'published'} for post_id in post_ids])
+
+
+def embed_images(html_content: str, image_urls: list[str]) -> str:
+    """Prepend Ghost image cards for the given (CDN) URLs to the post HTML."""
+    figures = "".join(
+        f'<figure class="kg-card kg-image-card"><img src="{url}" class="kg-image" alt="" loading="lazy"></figure>'
+        for url in image_urls
+    )
+    return figures + html_content
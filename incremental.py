@@ -0,0 +1,202 @@
+import re
+import json
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from prompt_payload import compact_json, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 超過此比例的區塊有變動時改為一次完整渲染 (多次區塊呼叫的 prompt 總量會超過一次完整渲染)
+MAX_CHANGED_FRACTION = 0.5
+
+# 版型中的區塊以編號註解開頭 (例如 <!-- 4. MOVERS -->)，區塊內容為註解之後的第一個元素
+SECTION_MARKER_RE = re.compile(r"<!--\s*(\d+)\.\s[^>]*?-->")
+_COMMENT_RE = re.compile(r"<!--.*?-->", re.S)
+_TAG_RE = re.compile(r"<(/?)([A-Za-z][\w-]*)\b[^>]*?(/?)>")
+
+
+def content_hash(*parts) -> str:
+    """Short, stable hash of JSON-serializable parts (dataclass rows hash by their repr)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(compact_json(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()[:16]
+
+
+def news_fingerprint(news_items: list[dict]) -> str:
+    """Order-independent fingerprint of the article set a symbol summary is built from."""
+    return content_hash(sorted(
+        (item.get('publishedDate') or "", item.get('title') or "", item.get('text') or "")
+        for item in news_items
+    ))
+
+
+def _element_end(masked: str, pos: int) -> Optional[int]:
+    """End offset of the first element starting after `pos` (same-name tags balanced)."""
+    first = _TAG_RE.search(masked, pos)
+    if first is None or first.group(1) or first.group(3):
+        return None
+    name = first.group(2).lower()
+    depth = 0
+    for tag in _TAG_RE.finditer(masked, first.start()):
+        if tag.group(2).lower() != name or tag.group(3):
+            continue
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return tag.end()
+    return None
+
+
+def split_sections(html: str) -> Optional[dict[str, tuple[int, int]]]:
+    """
+    {section number: (start, end)} spanning each numbered marker comment and the
+    element that follows it. None when a section cannot be delimited or a number
+    repeats, so callers fall back to rendering the whole document.
+    """
+    # 比對標籤前先遮蔽註解 (版型的註解中含有範例 <tr>)，長度不變以保留位置
+    masked = _COMMENT_RE.sub(lambda m: " " * len(m.group()), html)
+    spans = {}
+    for marker in SECTION_MARKER_RE.finditer(html):
+        end = _element_end(masked, marker.end())
+        if end is None or marker.group(1) in spans:
+            return None
+        spans[marker.group(1)] = (marker.start(), end)
+    return spans
+
+
+def replace_sections(html: str, fragments: dict[str, str]) -> str:
+    spans = split_sections(html)
+    for number in sorted(fragments, key=lambda n: spans[n][0], reverse=True):
+        start, end = spans[number]
+        html = html[:start] + fragments[number] + html[end:]
+    return html
+
+
+class RenderCache:
+    """Last rendered HTML per report kind, with the input hash of each of its sections."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _path(self, kind: str) -> Path:
+        return self.root / f"{kind}.json"
+
+    def load(self, kind: str) -> Optional[dict]:
+        path = self._path(kind)
+        if not path.exists():
+            return None
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read render cache {path}: {e}")
+            return None
+
+    def save(self, kind: str, entry: dict):
+        path = self._path(kind)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+            tmp_path.replace(path)
+        except OSError as e:
+            logger.warning(f"Could not save render cache {path}: {e}")
+
+
+@dataclass
+class IncrementalStats:
+    """Work done vs. skipped in one run (LLM summaries and HTML sections)."""
+    llm_calls: int = 0
+    llm_reused: int = 0
+    tokens_skipped: int = 0  # 估計省下的 prompt/輸出 tokens
+    sections_rendered: int = 0
+    sections_reused: int = 0
+    full_renders: int = 0
+    section_prompt_tokens: int = 0  # 區塊渲染額外送出的 prompt tokens (從省下的 tokens 中扣除)
+
+    def called(self, count: int = 1):
+        self.llm_calls += count
+
+    def reused(self, tokens: int = 0, count: int = 1):
+        self.llm_reused += count
+        self.tokens_skipped += tokens
+
+    def section_prompt(self, tokens: int):
+        self.section_prompt_tokens += tokens
+
+    def summary(self) -> str:
+        llm_total = self.llm_calls + self.llm_reused
+        sections_total = self.sections_rendered + self.sections_reused
+        return (
+            f"摘要 LLM 呼叫 {self.llm_calls} 次、沿用 {self.llm_reused}/{llm_total}；"
+            f"HTML 區塊重新渲染 {self.sections_rendered}、沿用 {self.sections_reused}/{sections_total}"
+            f" (完整渲染 {self.full_renders} 次，區塊 prompt {self.section_prompt_tokens} tokens)；"
+            f"淨省約 {self.tokens_skipped - self.section_prompt_tokens} tokens"
+        )
+
+
+async def render_incremental(kind: str, template: str, section_inputs: dict, render_full, render_section,
+                             cache: RenderCache, stats: IncrementalStats, enabled: bool = True,
+                             full_prompt_tokens: int = 0) -> str:
+    """
+    Render `template` into HTML, re-rendering only the sections whose inputs changed
+    since the cached render of the same kind and splicing them into that render.
+    :param section_inputs: {section number: data the section is filled from}
+    :param render_full: async () -> complete HTML document
+    :param render_section: async (number, template fragment) -> HTML fragment of that section
+    :param full_prompt_tokens: estimated prompt size of render_full, counted as skipped when patching
+    Falls back to a full render on the first run, after a template change, when more
+    than MAX_CHANGED_FRACTION of the sections changed, or when the cached render / a
+    returned fragment cannot be split into sections.
+    """
+    template_hash = content_hash(template)
+    hashes = {number: content_hash(template_hash, number, data) for number, data in section_inputs.items()}
+    template_spans = split_sections(template)
+
+    html = None
+    cached = cache.load(kind) if enabled else None
+    if cached and cached.get('template_hash') == template_hash and template_spans and set(template_spans) == set(hashes):
+        previous_spans = split_sections(cached['html'])
+        if previous_spans and set(previous_spans) == set(hashes):
+            changed = [number for number in hashes if cached['sections'].get(number) != hashes[number]]
+            try:
+                if len(changed) > len(hashes) * MAX_CHANGED_FRACTION:
+                    raise ValueError(f"{len(changed)}/{len(hashes)} sections changed")
+                html = await _patch_sections(cached['html'], template, template_spans, changed, render_section)
+            except ValueError as e:
+                print(f"   [!] [{kind}] 改為完整渲染: {e}")
+            else:
+                stats.sections_rendered += len(changed)
+                stats.sections_reused += len(hashes) - len(changed)
+                stats.tokens_skipped += full_prompt_tokens + sum(
+                    estimate_tokens(cached['html'][slice(*previous_spans[n])]) for n in hashes if n not in changed
+                )
+                print(f"[*] [{kind}] 增量渲染：更新區塊 {changed or '無'}，沿用 {len(hashes) - len(changed)} 個區塊")
+
+    if html is None:
+        html = await render_full()
+        stats.full_renders += 1
+        stats.sections_rendered += len(hashes)
+
+    cache.save(kind, {'template_hash': template_hash, 'sections': hashes, 'html': html})
+    return html
+
+
+async def _patch_sections(html, template, template_spans, changed, render_section) -> str:
+    if not changed:
+        return html
+    results = await asyncio.gather(*(
+        render_section(number, template[slice(*template_spans[number])]) for number in changed
+    ))
+    fragments = {}
+    for number, fragment in zip(changed, results):
+        spans = split_sections(fragment or "")
+        if not spans or list(spans) != [number]:
+            raise ValueError(f"section {number} was not returned as a single marked section")
+        fragments[number] = fragment[slice(*spans[number])]
+    return replace_sections(html, fragments)
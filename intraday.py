@@ -0,0 +1,199 @@
+import json
+import time
+import heapq
+import asyncio
+import datetime
+import itertools
+import logging
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+NY_TZ = ZoneInfo("America/New_York")
+
+
+class MoversTracker:
+    """
+    Incrementally maintained top/bottom-k movers by % change.
+
+    Every update pushes one entry onto a max-heap and a min-heap and bumps the
+    symbol's version; superseded entries are discarded lazily when they surface.
+    Heaps are rebuilt once they exceed twice the universe size, so memory stays
+    O(universe) and per-tick work is O(changed * log n + k * log n).
+    """
+
+    def __init__(self, k: int = 6):
+        self.k = k
+        self._values = {}     # symbol -> (change, price)
+        self._version = {}    # symbol -> seq of the live heap entry
+        self._top = []        # (-change, seq, symbol)
+        self._bottom = []     # (change, seq, symbol)
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._values)
+
+    def update(self, symbol: str, change: float, price=None) -> bool:
+        """Apply one quote; returns False when the % change did not move."""
+        previous = self._values.get(symbol)
+        self._values[symbol] = (change, price)
+        if previous is not None and previous[0] == change:
+            return False
+        seq = next(self._seq)
+        self._version[symbol] = seq
+        heapq.heappush(self._top, (-change, seq, symbol))
+        heapq.heappush(self._bottom, (change, seq, symbol))
+        if len(self._top) > 2 * len(self._values) + 64:
+            self._compact()
+        return True
+
+    def _compact(self):
+        self._top = [e for e in self._top if self._version.get(e[2]) == e[1]]
+        self._bottom = [e for e in self._bottom if self._version.get(e[2]) == e[1]]
+        heapq.heapify(self._top)
+        heapq.heapify(self._bottom)
+
+    def _peek_k(self, heap: list) -> list[str]:
+        # 取出前 k 個有效項目後再放回；過期項目直接丟棄
+        valid = []
+        while heap and len(valid) < self.k:
+            entry = heapq.heappop(heap)
+            if self._version.get(entry[2]) == entry[1]:
+                valid.append(entry)
+        for entry in valid:
+            heapq.heappush(heap, entry)
+        return [entry[2] for entry in valid]
+
+    def top(self) -> list[str]:
+        return self._peek_k(self._top)
+
+    def bottom(self) -> list[str]:
+        return self._peek_k(self._bottom)
+
+    def quote(self, symbol: str):
+        return self._values.get(symbol)
+
+
+def rank_changed(previous: list[str], current: list[str], rank_threshold: int) -> bool:
+    """
+    True if any symbol moved more than `rank_threshold` places. A symbol outside the
+    list counts as ranked just below it, so a newcomer (or a dropped member) only
+    counts when it entered at (or left from) rank k - rank_threshold or better;
+    churn around the k-th place alone does not trigger an alert.
+    """
+    outside = max(len(previous), len(current))
+    old_rank = {symbol: i for i, symbol in enumerate(previous)}
+    new_rank = {symbol: i for i, symbol in enumerate(current)}
+    return any(
+        abs(old_rank.get(symbol, outside) - new_rank.get(symbol, outside)) > rank_threshold
+        for symbol in old_rank.keys() | new_rank.keys()
+    )
+
+
+class FMPQuotePoller:
+    """
+    Polls batched FMP quotes for the universe every `interval` seconds and yields
+    only ticks whose % change moved since the previous poll, as
+    [(symbol, changesPercentage, price), ...]. Stops at `stop_at` (aware datetime).
+    """
+
+    def __init__(self, fmp_client, symbols: list[str], interval: float = 60, stop_at=None):
+        self.fmp_client = fmp_client
+        self.symbols = symbols
+        self.interval = interval
+        self.stop_at = stop_at
+        self._last = {}
+
+    def _diff(self, quotes: list[dict]) -> list[tuple]:
+        ticks = []
+        for q in quotes:
+            symbol, change = q.get('symbol'), q.get('changesPercentage')
+            if symbol is None or change is None:
+                continue
+            if self._last.get(symbol) != change:
+                self._last[symbol] = change
+                ticks.append((symbol, change, q.get('price')))
+        return ticks
+
+    async def __aiter__(self):
+        while self.stop_at is None or datetime.datetime.now(self.stop_at.tzinfo) < self.stop_at:
+            started = time.monotonic()
+            quotes = await asyncio.to_thread(self.fmp_client.get_batch_quotes, self.symbols)
+            ticks = self._diff(quotes)
+            if ticks:
+                yield ticks
+            await asyncio.sleep(max(0, self.interval - (time.monotonic() - started)))
+
+
+class ReplayFeed:
+    """
+    Replays a feed recorded by `record_feed` (JSON lines of {"t": epoch, "ticks": [...]}).
+    :param speed: playback speed relative to recording time; 0 = as fast as possible
+    """
+
+    def __init__(self, path, speed: float = 0):
+        self.path = Path(path)
+        self.speed = speed
+
+    async def __aiter__(self):
+        previous_t = None
+        with self.path.open(encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if self.speed and previous_t is not None:
+                    await asyncio.sleep(max(0, (record['t'] - previous_t) / self.speed))
+                previous_t = record['t']
+                yield [tuple(tick) for tick in record['ticks']]
+
+
+async def record_feed(feed, path):
+    """Pass batches through while appending them to `path` for later replay."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a", encoding="utf-8") as f:
+        async for ticks in feed:
+            f.write(json.dumps({'t': time.time(), 'ticks': ticks}, ensure_ascii=False) + "\n")
+            f.flush()
+            yield ticks
+
+
+def format_movers_alert(tracker: MoversTracker, top: list[str], bottom: list[str]) -> str:
+    now_ny = datetime.datetime.now(NY_TZ)
+    lines = [f"⚡ 盤中異動 {now_ny.strftime('%Y-%m-%d %H:%M')} (ET)"]
+    for title, symbols in (("📈 漲幅最大", top), ("📉 跌幅最大", bottom)):
+        lines.append(title)
+        for rank, symbol in enumerate(symbols, 1):
+            change, price = tracker.quote(symbol)
+            lines.append(f"  {rank}. {symbol}: {price} ({change:+.2f}%)")
+    return "\n".join(lines)
+
+
+async def run_intraday(feed, notify, k: int = 6, rank_threshold: int = 2):
+    """
+    Consume a quote feed, maintain top/bottom-k movers and call `notify(text)` only
+    when a symbol enters, leaves or moves within the lists by more than
+    `rank_threshold` places (see `rank_changed`).
+    """
+    tracker = MoversTracker(k)
+    published_top, published_bottom = None, None
+    ticks_seen = 0
+
+    async for ticks in feed:
+        changed = 0
+        for symbol, change, price in ticks:
+            changed += tracker.update(symbol, change, price)
+        ticks_seen += len(ticks)
+        if not changed:
+            continue
+
+        top, bottom = tracker.top(), tracker.bottom()
+        if published_top is None or rank_changed(published_top, top, rank_threshold) \
+                or rank_changed(published_bottom, bottom, rank_threshold):
+            await notify(format_movers_alert(tracker, top, bottom))
+            published_top, published_bottom = top, bottom
+
+    logger.info(f"Intraday feed finished: {ticks_seen} ticks, {len(tracker)} symbols")
+    return tracker
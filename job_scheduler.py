@@ -0,0 +1,266 @@
+import os
+import json
+import asyncio
+import datetime
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+from zoneinfo import ZoneInfo
+
+from market_calendar import is_trading_day, session_date
+
+try:
+    import fcntl
+except ImportError:  # Windows: 不支援跨進程鎖，僅保留進程內防重入
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class CronSpec:
+    """
+    Minimal 5-field cron expression: "minute hour day-of-month month day-of-week".
+    Fields accept `*`, `*/n`, `a`, `a-b`, `a-b/n` and comma lists; day-of-week
+    uses cron numbering (0 = Sunday). As in cron, when both day fields are
+    restricted a day matches if either one does.
+    """
+
+    _RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+    def __init__(self, expr: str):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid cron expression (need 5 fields): {expr!r}")
+        self.expr = expr
+        parsed = [self._parse(f, lo, hi) for f, (lo, hi) in zip(fields, self._RANGES)]
+        self.minutes, self.hours, self.days, self.months, self.weekdays = parsed
+        self._dom_any = fields[2] == "*"
+        self._dow_any = fields[4] == "*"
+
+    def __repr__(self):
+        return f"CronSpec({self.expr!r})"
+
+    @staticmethod
+    def _parse(field_expr: str, lo: int, hi: int) -> tuple:
+        values = set()
+        for part in field_expr.split(","):
+            step = 1
+            if "/" in part:
+                part, step_str = part.split("/")
+                step = int(step_str)
+            if part == "*":
+                start, end = lo, hi
+            elif "-" in part:
+                start, end = (int(x) for x in part.split("-"))
+            else:
+                start = end = int(part)
+            if start < lo or end > hi or start > end or step < 1:
+                raise ValueError(f"Cron field out of range: {field_expr!r}")
+            values.update(range(start, end + 1, step))
+        return tuple(sorted(values))
+
+    def matches_day(self, day: datetime.date) -> bool:
+        if day.month not in self.months:
+            return False
+        dom_ok = day.day in self.days
+        dow_ok = (day.weekday() + 1) % 7 in self.weekdays
+        if self._dom_any or self._dow_any:
+            return dom_ok and dow_ok
+        return dom_ok or dow_ok
+
+    def _fire_times(self, day: datetime.date, tz: ZoneInfo):
+        for hour in self.hours:
+            for minute in self.minutes:
+                yield datetime.datetime.combine(day, datetime.time(hour, minute), tzinfo=tz)
+
+    def next_after(self, moment: datetime.datetime, tz: ZoneInfo, horizon_days: int = 400) -> datetime.datetime:
+        """First fire time strictly after `moment`, evaluated in `tz`."""
+        local = moment.astimezone(tz)
+        for offset in range(horizon_days):
+            day = local.date() + datetime.timedelta(days=offset)
+            if not self.matches_day(day):
+                continue
+            for fire in self._fire_times(day, tz):
+                if fire > local:
+                    return fire
+        raise ValueError(f"{self} has no fire time within {horizon_days} days")
+
+    def previous_before(self, moment: datetime.datetime, tz: ZoneInfo, horizon_days: int = 400) -> Optional[datetime.datetime]:
+        """Latest fire time at or before `moment`, evaluated in `tz`."""
+        local = moment.astimezone(tz)
+        for offset in range(horizon_days):
+            day = local.date() - datetime.timedelta(days=offset)
+            if not self.matches_day(day):
+                continue
+            for fire in reversed(list(self._fire_times(day, tz))):
+                if fire <= local:
+                    return fire
+        return None
+
+
+@dataclass
+class Job:
+    """
+    A scheduled job.
+    :param func: async callable receiving (fire_time, context) where context is what
+                 `prepare` returned (None when there is no warm-up)
+    :param trading_days_only: skip fire times whose US exchange-local date is not a
+                 trading day (e.g. 05:55 Taipei maps to the previous US session)
+    :param catch_up: a missed fire time no older than this is executed once on startup
+    :param warmup: lead time before the fire time at which `prepare` is awaited;
+                 the returned context's `close()` is awaited after the run
+    :param completed: optional (fire_time) -> bool telling whether that fire's output
+                 already exists; consulted when there is no state for the job (e.g. a
+                 fresh container) so a missed fire can still be caught up
+    """
+    name: str
+    cron: CronSpec
+    func: Callable[..., Awaitable]
+    tz: ZoneInfo = field(default_factory=lambda: ZoneInfo("Asia/Taipei"))
+    trading_days_only: bool = True
+    catch_up: datetime.timedelta = datetime.timedelta(hours=6)
+    warmup: datetime.timedelta = datetime.timedelta(0)
+    prepare: Optional[Callable[[], Awaitable]] = None
+    completed: Optional[Callable[[datetime.datetime], bool]] = None
+
+    def should_run(self, fire_time: datetime.datetime) -> bool:
+        return not self.trading_days_only or is_trading_day(session_date(fire_time))
+
+
+class JobScheduler:
+    """
+    Runs several cron-like jobs, persists each job's last fire time to a JSON
+    state file, catches up a missed run once after a restart and never lets a
+    job overlap with itself (in-process lock) or with another scheduler
+    process (exclusive file lock on the state file).
+    """
+
+    def __init__(self, jobs: list[Job], state_path: Path):
+        self.jobs = {job.name: job for job in jobs}
+        self.state_path = Path(state_path)
+        self.state = self._load_state()
+        self._locks = {name: asyncio.Lock() for name in self.jobs}
+        self._lock_file = None
+
+    def _load_state(self) -> dict:
+        try:
+            return json.loads(self.state_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Could not read scheduler state {self.state_path}: {e}")
+            return {}
+
+    def _save_state(self):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.state, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.state_path)
+
+    def _last_fire(self, name: str) -> Optional[datetime.datetime]:
+        value = self.state.get(name, {}).get("last_fire")
+        return datetime.datetime.fromisoformat(value) if value else None
+
+    def _record(self, name: str, fire_time: datetime.datetime, status: str):
+        self.state[name] = {
+            "last_fire": fire_time.isoformat(),
+            "status": status,
+            "finished_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        self._save_state()
+
+    def _acquire_process_lock(self):
+        if fcntl is None:
+            return
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock_file = open(self.state_path.with_suffix(".lock"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            raise RuntimeError(f"另一個排程程序正在執行 (鎖定檔: {self.state_path.with_suffix('.lock')})")
+
+    async def run_job(self, job: Job, fire_time: datetime.datetime, context=None):
+        """Execute one fire of `job` unless it is already running or the market was closed."""
+        lock = self._locks[job.name]
+        if lock.locked():
+            print(f"[!] [{job.name}] 上一次執行尚未結束，略過 {fire_time:%Y-%m-%d %H:%M}")
+            return
+        async with lock:
+            if not job.should_run(fire_time):
+                print(f"[!] [{job.name}] {session_date(fire_time)} 美股休市，跳過執行。")
+                self._record(job.name, fire_time, "holiday")
+                return
+            print(f"\n[⏰] [{job.name}] 開始執行 ({fire_time:%Y-%m-%d %H:%M %Z})")
+            status = "ok"
+            try:
+                await job.func(fire_time, context)
+            except Exception as e:
+                status = "error"
+                logger.exception(f"Job {job.name} failed: {e}")
+                print(f"[❌] [{job.name}] 執行失敗: {e}")
+            finally:
+                self._record(job.name, fire_time, status)
+
+    async def _catch_up(self, job: Job):
+        now = datetime.datetime.now(job.tz)
+        last_fire = self._last_fire(job.name)
+        missed = job.cron.previous_before(now, job.tz)
+        if missed is None:
+            return
+        if last_fire is None:
+            # 沒有狀態 (首次啟動或狀態檔遺失)：工作能判斷該次產出是否存在時，以此決定是否補跑；否則只記錄基準點
+            if job.completed is None or job.completed(missed):
+                self._record(job.name, missed, "initialized")
+                return
+            print(f"[*] [{job.name}] 找不到排程狀態，且 {missed:%Y-%m-%d %H:%M} 的產出不存在")
+        elif missed <= last_fire:
+            return
+        if now - missed > job.catch_up:
+            print(f"[!] [{job.name}] 錯過 {missed:%Y-%m-%d %H:%M} 的執行，已超過補跑期限，略過。")
+            self._record(job.name, missed, "expired")
+            return
+        print(f"[*] [{job.name}] 補跑錯過的排程 {missed:%Y-%m-%d %H:%M}")
+        await self.run_job(job, missed)
+
+    async def _job_loop(self, job: Job):
+        await self._catch_up(job)
+        while True:
+            now = datetime.datetime.now(job.tz)
+            fire_time = job.cron.next_after(now, job.tz)
+            print(f"[*] [{job.name}] 下次執行: {fire_time:%Y-%m-%d %H:%M %Z}")
+
+            context = None
+            try:
+                if job.prepare is not None and job.should_run(fire_time):
+                    await _sleep_until(fire_time - job.warmup)
+                    try:
+                        context = await job.prepare()
+                    except Exception as e:
+                        print(f"[!] [{job.name}] 預熱失敗，將以冷啟動執行: {e}")
+                await _sleep_until(fire_time)
+                await self.run_job(job, fire_time, context)
+            finally:
+                if context is not None:
+                    await context.close()
+
+    async def run(self):
+        """Run all jobs until cancelled."""
+        self._acquire_process_lock()
+        try:
+            await asyncio.gather(*(self._job_loop(job) for job in self.jobs.values()))
+        finally:
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+
+async def _sleep_until(moment: datetime.datetime):
+    # 分段睡眠，避免系統休眠或時鐘調整造成長時間漂移
+    while True:
+        remaining = (moment - datetime.datetime.now(moment.tzinfo)).total_seconds()
+        if remaining <= 0:
+            return
+        await asyncio.sleep(min(remaining, 600))
@@ -0,0 +1,230 @@
+import json
+import math
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+    """Absolute deadline on the monotonic clock."""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+_current_deadline = contextvars.ContextVar("llm_deadline", default=None)
+
+
+def enter_deadline(seconds: float):
+    """
+    Set the deadline for every LLM call made in this context (including calls made
+    from asyncio.to_thread, which copies the context). A nested deadline can only
+    tighten the outer one. Returns a token for `exit_deadline`.
+    """
+    outer = _current_deadline.get()
+    deadline = Deadline(seconds)
+    if outer is not None and outer.expires_at < deadline.expires_at:
+        deadline = outer
+    return _current_deadline.set(deadline)
+
+
+def exit_deadline(token):
+    _current_deadline.reset(token)
+
+
+@contextmanager
+def deadline_scope(seconds: float):
+    token = enter_deadline(seconds)
+    try:
+        yield _current_deadline.get()
+    finally:
+        exit_deadline(token)
+
+
+def current_deadline():
+    return _current_deadline.get()
+
+
+class LatencyHistogram:
+    """Log-spaced latency histogram (0.1s .. ~20min, 10 buckets per decade)."""
+
+    _MIN = 0.1
+    _PER_DECADE = 10
+    _BUCKETS = 41
+
+    def __init__(self, counts=None):
+        self.counts = list(counts) if counts else [0] * self._BUCKETS
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def record(self, seconds: float):
+        index = 0
+        if seconds > self._MIN:
+            index = min(self._BUCKETS - 1, int(math.log10(seconds / self._MIN) * self._PER_DECADE) + 1)
+        self.counts[index] += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket containing quantile q (conservative)."""
+        target = q * self.total
+        running = 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if running >= target and count:
+                return self._MIN * 10 ** (index / self._PER_DECADE)
+        return self._MIN * 10 ** ((self._BUCKETS - 1) / self._PER_DECADE)
+
+
+class LatencyStats:
+    """Per (model, stage) histograms, persisted as JSON so hedge thresholds survive restarts."""
+
+    MIN_SAMPLES = 5
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.histograms = {}
+        self._lock = threading.Lock()
+        if self.path and self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+                self.histograms = {key: LatencyHistogram(counts) for key, counts in data.items()}
+            except Exception as e:
+                logger.warning(f"Could not read latency stats {self.path}: {e}")
+
+    def record(self, model: str, stage: str, seconds: float):
+        with self._lock:
+            self.histograms.setdefault(f"{model}|{stage}", LatencyHistogram()).record(seconds)
+
+    def p95(self, model: str, stage: str, default: float) -> float:
+        histogram = self.histograms.get(f"{model}|{stage}")
+        if histogram is None or histogram.total < self.MIN_SAMPLES:
+            return default
+        return histogram.quantile(0.95)
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._lock:
+                data = {key: list(h.counts) for key, h in self.histograms.items()}
+            self.path.write_text(json.dumps(data), encoding="utf-8")
+        except Exception as e:
+            logger.warning(f"Could not save latency stats {self.path}: {e}")
+
+
+def strip_code_fence(text: str) -> str:
+    text = (text or "").strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
+def is_valid_json(text: str) -> bool:
+    try:
+        json.loads(strip_code_fence(text))
+        return True
+    except (ValueError, TypeError):
+        return False
+
+
+def is_valid_html(text: str) -> bool:
+    body = strip_code_fence(text).lower()
+    return "<html" in body and "</html>" in body
+
+
+def is_non_empty(text: str) -> bool:
+    return bool(text and text.strip())
+
+
+CALL_TIMEOUT_FACTOR = 4
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm")
+
+
+def hedged_call(call, models: list[str], stage: str, stats: LatencyStats, validate=is_non_empty,
+                hedge_default: float = 30.0, deadline: Deadline = None):
+    """
+    Run `call(model, timeout_seconds)` on models[0]; if it has not returned a valid answer
+    within that model's p95 for this stage, also start models[1], and so on. The
+    first valid answer wins; late, failed and timed-out calls are still recorded in the
+    histograms. A failed or invalid answer immediately promotes the next tier. Every
+    tier but the last is cut off at CALL_TIMEOUT_FACTOR x its p95; the last one may
+    run until the deadline.
+    :return: (model, response)
+    """
+    pending = {}
+    tiers = list(models)
+    last_error = None
+
+    def launch():
+        model = tiers.pop(0)
+        threshold = stats.p95(model, stage, hedge_default)
+        # 單次請求上限：門檻的 CALL_TIMEOUT_FACTOR 倍，且不超過 deadline，讓被放棄的請求及早釋放執行緒。
+        # 沒有下一層備援時不提早中斷，最後一層可一直執行到 deadline
+        timeout = threshold * CALL_TIMEOUT_FACTOR if tiers else None
+        if deadline:
+            timeout = deadline.remaining() if timeout is None else min(timeout, deadline.remaining())
+        started = time.monotonic()
+
+        def on_done(future):
+            # 每個送出的請求都要記錄，包含逾時、失敗與輸掉競賽的請求；否則 p95 會偏低而越砍越多。
+            # 失敗的請求至少記為 timeout 秒
+            elapsed = time.monotonic() - started
+            if future.exception() is not None and timeout is not None:
+                elapsed = max(elapsed, timeout)
+            stats.record(model, stage, elapsed)
+
+        future = _executor.submit(call, model, timeout)
+        future.add_done_callback(on_done)
+        pending[future] = model
+        return threshold
+
+    next_hedge = time.monotonic() + launch()
+    while pending:
+        if deadline and deadline.expired():
+            raise DeadlineExceeded(f"{stage}: deadline exceeded with {list(pending.values())} still running")
+        waits = [deadline.remaining()] if deadline else []
+        if tiers:
+            waits.append(max(0.0, next_hedge - time.monotonic()))
+        done, _ = wait(pending, timeout=min(waits) if waits else None, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            model = pending.pop(future)
+            try:
+                response = future.result()
+            except Exception as e:
+                last_error = e
+                print(f"   [!] [{stage}] {model} 失敗: {e}")
+                continue
+            if validate(getattr(response, 'text', None)):
+                for other in pending.values():
+                    logger.info(f"{stage}: {model} won, abandoning {other}")
+                return model, response
+            last_error = ValueError(f"{model} returned an invalid answer")
+            print(f"   [!] [{stage}] {model} 回傳格式無效")
+
+        if tiers and (not pending or time.monotonic() >= next_hedge):
+            model = tiers[0]
+            print(f"   [*] [{stage}] 啟動備援模型 {model}")
+            next_hedge = time.monotonic() + launch()
+
+    raise last_error or RuntimeError(f"{stage}: no model produced an answer")
@@ -1,23 +1,38 @@
 import os
+import re
+import sys
 import asyncio
 import datetime
 import argparse
 import time
 import tempfile
 import shutil
+import dataclasses
 from pathlib import Path
 from dotenv import load_dotenv
-from google import genai
 from google.genai import types
 from playwright.async_api import async_playwright
 from telegram import Bot
 from zoneinfo import ZoneInfo
-import json
 
 from fmp_client import FMPClient
 from scraper import get_market_recap_content
-from generate import summarize_market_recap
-from ghost_client import GhostClient
+from generate import (
+    client, MODEL_NAME, SUMMARY_ERROR_PREFIX, summarize_company_news, summarize_market_recap,
+    generate_content, token_report,
+)
+from prompt_payload import FIELD_BUDGETS, TRANSLATED_BUDGETS, estimate_tokens, format_market_payload, format_news_items, truncate
+from snapshot import MarketSnapshot, Quote, SnapshotArchive, report_date_iso
+from incremental import IncrementalStats, RenderCache, content_hash, news_fingerprint, render_incremental
+from llm_hedge import enter_deadline, exit_deadline, strip_code_fence
+from variants import (
+    SOURCE_LANGUAGE, SharedTasks, Translator, fill_prompt, filter_quotes, load_variants, variant_snapshot,
+)
+from ghost_client import AsyncGhostClient, embed_images
+from warmup import warm_up
+from job_scheduler import CronSpec, Job, JobScheduler
+from intraday import FMPQuotePoller, ReplayFeed, record_feed, run_intraday
+from resource_guard import ResourceAudit, format_report_line, parse_report_line
 
 # 取得專案根目錄 (確保在任何位置執行都能以此為基準)
 BASE_DIR = Path(__file__).resolve().parent
@@ -31,6 +46,38 @@ TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 FMP_API_KEY = os.getenv("FMP_API_KEY")
 
+# 排程預熱時間 (分鐘)：在目標時間前預先建立連線、啟動瀏覽器
+WARMUP_MINUTES = float(os.getenv("WARMUP_MINUTES", "5"))
+
+# 單次執行的時間預算 (分鐘)：所有 LLM 呼叫共用此 deadline
+RUN_DEADLINE_MINUTES = float(os.getenv("RUN_DEADLINE_MINUTES", "60"))
+
+# 各發佈管道 (Telegram / Ghost) 的最多嘗試次數與重試間隔 (秒)
+PUBLISH_ATTEMPTS = int(os.getenv("PUBLISH_ATTEMPTS", "2"))
+PUBLISH_RETRY_DELAY = float(os.getenv("PUBLISH_RETRY_DELAY", "10"))
+# Ghost 管道等待 Telegram 管道產生報告圖片的上限 (秒)；逾時則發佈不含圖片的文章
+GHOST_IMAGE_WAIT = float(os.getenv("GHOST_IMAGE_WAIT", "300"))
+# 同一天的 Ghost 文章若已被編輯發佈，重跑時預設不覆寫；設為 1 才以新內容更新 (仍不變更發佈狀態)
+GHOST_OVERWRITE_PUBLISHED = os.getenv("GHOST_OVERWRITE_PUBLISHED", "0") == "1"
+
+# 排程模式下每次執行是否在獨立子程序中進行 (避免函式庫的記憶體/資源洩漏長期累積)
+RUN_ISOLATED = os.getenv("RUN_ISOLATED", "0") == "1"
+
+# 每日 MarketSnapshot 存檔目錄
+snapshot_archive = SnapshotArchive(os.getenv("SNAPSHOT_ARCHIVE", BASE_DIR / "archive"))
+
+# 增量模式：與前一份 snapshot 比較，沿用新聞/回顧原文未變的摘要，只重新渲染輸入有變動的 HTML 區塊
+INCREMENTAL = os.getenv("INCREMENTAL", "0") == "1"
+render_cache = RenderCache(os.getenv("RENDER_CACHE", BASE_DIR / "state/render_cache"))
+
+# 報告版本 (不同 watchlist / 語言 / chat ID / 版型) 設定檔，與同時進行截圖的版本數上限
+REPORT_VARIANTS = Path(os.getenv("REPORT_VARIANTS", BASE_DIR / "variants.json"))
+VARIANT_RENDER_CONCURRENCY = int(os.getenv("VARIANT_RENDER_CONCURRENCY", "2"))
+
+# 排程模式啟用的工作 (逗號分隔) 與狀態檔位置
+SCHEDULER_JOBS = os.getenv("SCHEDULER_JOBS", "morning_report")
+SCHEDULER_STATE = Path(os.getenv("SCHEDULER_STATE", BASE_DIR / "state/scheduler_state.json"))
+
 # 引入 FMP Client
 fmp_client = FMPClient(api_key=FMP_API_KEY)
 
@@ -57,8 +104,7 @@ SECTOR_ETF_MAP = {
     "Utilities": "XLU"
 }
 
-# 設定 Gemini Client
-client = genai.Client(api_key=GEMINI_API_KEY)
+# 設定 Gemini 工具 (Client 與模型名稱共用 generate.py 的設定)
 grounding_tool = types.Tool(
     google_search=types.GoogleSearch()
 )
@@ -67,50 +113,46 @@ config = types.GenerateContentConfig(
     tools=[grounding_tool]
 )
 
-# 使用使用者指定的模型
-MODEL_NAME = "gemini-3-flash-preview"
+_template_cache = {}
+
+def read_template(relative_path):
+    """讀取 prompts/ 下的版型或 Prompt 並快取 (排程預熱時預先載入)
+    快取以檔案修改時間為鍵：排程模式下修改版型後，下一次執行即會重新讀取"""
+    path = BASE_DIR / relative_path
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        raise FileNotFoundError(f"找不到 {path}") from None
+    cached = _template_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _template_cache[path] = (mtime, path.read_text(encoding="utf-8"))
+    return cached[1]
 
 def fetch_market_data():
-    """獲取 FMP 市場數據"""
+    """獲取 FMP 市場數據，回傳 (指數, 板塊 ETF, 債券利率) 的 snapshot 資料列"""
     print("[*] 開始從 FMP 獲取市場數據...")
-    market_data_lines = []
     
     # 1. 獲取市場指數
     print("   - 正在獲取主要指數...")
+    indices = []
     for name, symbol in MARKET_SYMBOLS.items():
         try:
             price, change = fmp_client.get_stock_inf(symbol)
-            market_data_lines.append(f"{name}: Price {price}, Change {change}%")
+            indices.append(Quote(name, symbol, price, change))
         except Exception as e:
             print(f"   [!] 無法獲取 {name} ({symbol}): {e}")
-            market_data_lines.append(f"{name}: N/A")
+            indices.append(Quote(name, symbol, None, None))
 
-    # 2. 獲取板塊 ETF
+    # 2. 獲取板塊 ETF (全部保存，報告中的強/弱勢板塊由 MarketSnapshot.selected_sectors 挑選)
     print("   - 正在獲取板塊 ETF...")
-    sector_results = []
+    sectors = []
     for name, symbol in SECTOR_ETF_MAP.items():
         try:
             price, change = fmp_client.get_stock_inf(symbol)
-            sector_results.append({'name': name, 'symbol': symbol, 'price': price, 'change': change})
+            sectors.append(Quote(name, symbol, price, change))
         except Exception as e:
             print(f"   [!] 無法獲取 {name} ({symbol}): {e}")
     
-    if sector_results:
-        sector_results.sort(key=lambda x: x['change'], reverse=True)
-
-        selected_sectors = []
-        if len(sector_results) <= 6:
-            selected_sectors = sector_results
-        else:
-            top_3 = [x for x in sector_results if x['change'] > 0][:3]
-            bottom_3 = [x for x in sector_results if x['change'] < 0][:3]
-            selected_sectors = top_3 + bottom_3
-            
-        for s in selected_sectors:
-            market_data_lines.append(f"{s['name']}: Price {s['price']}, Change {s['change']}%")
-
-    market_data_str = "\n".join(market_data_lines)
-    
     # 3. 獲取債券利率
     print("   - 正在獲取債券利率...")
     try:
@@ -121,22 +163,14 @@ def fetch_market_data():
 
     print("[+] FMP 數據獲取完成")
 
-    return market_data_str, treasury_result
+    return tuple(indices), tuple(sectors), MarketSnapshot.treasury_from_dict(treasury_result)
 
 async def analyze_market(target_date, market_data_str, treasury_result, output_dir=None):
     """第一步：取得市場分析數據"""
-    prompt_path = BASE_DIR / "prompts/US_market_analysis.txt"
-    if not prompt_path.exists():
-        raise FileNotFoundError(f"找不到 {prompt_path}")
-    
-    base_prompt = prompt_path.read_text(encoding="utf-8")
+    base_prompt = read_template("prompts/US_market_analysis.txt")
     final_prompt = base_prompt.replace("使用者輸入日期 ( 如 2025 / 12 / 01 ) ", target_date)
     
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=final_prompt,
-        config=config
-    )
+    response = generate_content('market_analysis', final_prompt, config=config)
     
     report_text = response.text
     if output_dir:
@@ -145,15 +179,78 @@ async def analyze_market(target_date, market_data_str, treasury_result, output_d
 
     return report_text
 
-async def generate_html(target_date, market_data, output_dir):
-    template_path = BASE_DIR / "prompts/tg_template.html"
-    if not template_path.exists():
-        raise FileNotFoundError(f"找不到 {template_path}")
-    
-    html_template = template_path.read_text(encoding="utf-8")
-    
-    # 建立生成 HTML 的指令
-    generation_prompt = f"""
+# 增量渲染時附加於 prompt 之後：只生成單一區塊
+SECTION_ONLY_NOTE = """
+### [本次僅更新單一區塊]
+上方的版型只是完整版型中的一個區塊 (以 <!-- N. ... --> 註解開頭)。
+請只輸出這個區塊填入數據後的 HTML 片段，並保留開頭的註解；不要輸出 <html>、<head>、<style> 或其他區塊。
+"""
+
+_DATE_BADGE_RE = re.compile(r'(<span class="date-badge">).*?(</span>)', re.S)
+
+def tg_section_inputs(snapshot):
+    """Telegram 版型各編號區塊所依據的資料 (決定增量模式下哪些區塊需要重新渲染)"""
+    news = {n.symbol: n.summary for n in snapshot.news}
+
+    def movers(kind):
+        return [(m, news.get(m.symbol)) for m in snapshot.movers if m.kind == kind]
+
+    return {
+        '1': snapshot.indices,
+        '2': snapshot.selected_sectors(),
+        '3': snapshot.treasury,
+        '4': movers('Top Gainer'),
+        '5': movers('Top Loser'),
+        '6': snapshot.recap,
+    }
+
+def email_section_inputs(snapshot):
+    """Email 版型各編號區塊所依據的資料"""
+    news = {n.symbol: n.summary for n in snapshot.news}
+    return {
+        '1': snapshot.indices,
+        '2': snapshot.selected_sectors(),
+        '3': snapshot.treasury,
+        '4': [(m, news.get(m.symbol)) for m in snapshot.movers],
+        '5': snapshot.recap,
+    }
+
+_SNAPSHOT_TABLES = ('indices', 'sectors', 'treasury', 'movers', 'news', 'recap')
+
+def section_snapshot(snapshot, keep, mover_kind=None):
+    """只保留 keep 中的資料表 (其餘清空) 的 snapshot，讓單一區塊的 prompt 只帶該區塊需要的數據
+    mover_kind：只保留該類型的個股 (與其新聞摘要)"""
+    movers = tuple(m for m in snapshot.movers if mover_kind is None or m.kind == mover_kind)
+    symbols = {m.symbol for m in movers}
+    narrowed = dataclasses.replace(snapshot, movers=movers, news=tuple(n for n in snapshot.news if n.symbol in symbols))
+    return dataclasses.replace(narrowed, **{table: () for table in _SNAPSHOT_TABLES if table not in keep})
+
+def tg_section_payloads(snapshot, budgets=FIELD_BUDGETS):
+    """Telegram 版型各編號區塊的 prompt 數據"""
+    sections = {
+        '1': section_snapshot(snapshot, ('indices',)),
+        '2': section_snapshot(snapshot, ('sectors',)),
+        '3': section_snapshot(snapshot, ('treasury',)),
+        '4': section_snapshot(snapshot, ('movers', 'news'), mover_kind='Top Gainer'),
+        '5': section_snapshot(snapshot, ('movers', 'news'), mover_kind='Top Loser'),
+        '6': section_snapshot(snapshot, ('recap',)),
+    }
+    return {number: format_market_payload(section, budgets) for number, section in sections.items()}
+
+def email_section_payloads(snapshot, budgets=FIELD_BUDGETS):
+    """Email 版型各編號區塊的 prompt 數據"""
+    sections = {
+        '1': section_snapshot(snapshot, ('indices',)),
+        '2': section_snapshot(snapshot, ('sectors',)),
+        '3': section_snapshot(snapshot, ('treasury',)),
+        '4': section_snapshot(snapshot, ('movers', 'news')),
+        '5': section_snapshot(snapshot, ('recap',)),
+    }
+    return {number: format_market_payload(section, budgets) for number, section in sections.items()}
+
+def tg_html_prompt(target_date, payload, html_template):
+    """建立生成 HTML 的指令"""
+    return f"""
 你是一位專業的前端工程師與金融設計師。
 請根據提供的「市場數據」填入隨附的「HTML版型」中，生成一份完整的市場分析報告（繁體中文）。
 
@@ -172,34 +269,54 @@ async def generate_html(target_date, market_data, output_dir):
 ### [數據來源]
 
 **1. 市場指數與板塊數據 (Indices & Sectors):**
-{market_data.get('market_data_str', 'N/A')}
+{payload['market_data_str']}
 
 **2. 債券利率 (Treasury Rates):**
-{market_data.get('treasury_result', 'N/A')}
+{payload['treasury']}
 
 **3. 市場回顧重點 (Market Recap):**
-{json.dumps(market_data.get('recap_summary', []), indent=2, ensure_ascii=False)}
+{payload['recap']}
 
 **4. 最大變動個股 (Biggest Movers):**
-{json.dumps(market_data.get('biggest_change_sp500_stock', []), indent=2, ensure_ascii=False)}
+{payload['movers']}
 
 **5. 個股新聞總結 (Symbol News Summaries):**
-{json.dumps(market_data.get('symbol_news_summary', {}), indent=2, ensure_ascii=False)}
+{payload['news']}
 
 ### [HTML 原始版型]
 {html_template}
 """
+
+async def generate_html(target_date, snapshot, output_dir, incremental=False, stats=None,
+                        template_path="prompts/tg_template.html", build_prompt=tg_html_prompt, cache_kind='tg_html',
+                        budgets=FIELD_BUDGETS):
+    """第二步：生成 Telegram 版 HTML
+    incremental=True 時只重新渲染輸入有變動的區塊，其餘沿用上一次的渲染結果。
+    template_path / build_prompt / cache_kind：報告版本 (variants) 可替換版型與 prompt，並使用各自的渲染快取。
+    budgets：數據欄位的字元預算 (已翻譯的 snapshot 使用 TRANSLATED_BUDGETS)。"""
+    html_template = read_template(template_path)
+    payload = format_market_payload(snapshot, budgets)
+    stats = stats if stats is not None else IncrementalStats()
+
+    full_prompt = build_prompt(target_date, payload, html_template)
+
+    async def render_full():
+        response = await asyncio.to_thread(generate_content, 'tg_html', full_prompt)
+        return strip_code_fence(response.text)
+
+    async def render_section(number, fragment):
+        prompt = build_prompt(target_date, tg_section_payloads(snapshot, budgets)[number], fragment) + SECTION_ONLY_NOTE
+        stats.section_prompt(estimate_tokens(prompt))
+        response = await asyncio.to_thread(generate_content, 'html_section', prompt)
+        return strip_code_fence(response.text)
+
     try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=generation_prompt
+        html_content = await render_incremental(
+            cache_kind, html_template, tg_section_inputs(snapshot), render_full, render_section,
+            render_cache, stats, enabled=incremental, full_prompt_tokens=estimate_tokens(full_prompt),
         )
-        html_content = response.text.strip()
-        if html_content.startswith("```html"):
-            html_content = html_content[7:]
-        if html_content.endswith("```"):
-            html_content = html_content[:-3]
-        html_content = html_content.strip()
+        # 日期不屬於任何編號區塊，沿用的渲染結果直接替換日期
+        html_content = _DATE_BADGE_RE.sub(lambda m: f"{m.group(1)}{target_date}{m.group(2)}", html_content, count=1)
 
         html_file = output_dir / f"market_report_{target_date.replace('/', '').replace(' ', '')}.html"
         html_file.write_text(html_content, encoding="utf-8")
@@ -208,79 +325,116 @@ async def generate_html(target_date, market_data, output_dir):
         print(f"[!] 生成 HTML 時發生錯誤: {e}")
         raise
 
-async def convert_to_images(html_file_path):
-    """第三步：將 HTML 轉換為兩張 PNG 圖片 (Part 1 & Part 2)"""
-    image_paths = []
-    
+async def convert_to_images(html_file_path, page=None, browser=None):
+    """第三步：將 HTML 轉換為兩張 PNG 圖片 (Part 1 & Part 2)
+    若傳入已預熱的 page，直接沿用該瀏覽器分頁 (字型/CSS 已快取)；
+    若傳入已預熱的 browser，在其上開新分頁 (多個版本可同時截圖)。"""
+    if page is not None:
+        return await _capture_parts(page, html_file_path)
+    if browser is not None:
+        page = await browser.new_page(device_scale_factor=3)
+        try:
+            await page.set_viewport_size({"width": 1000, "height": 2000})
+            return await _capture_parts(page, html_file_path)
+        finally:
+            await page.close()
+
     async with async_playwright() as p:
         browser = await p.chromium.launch()
         page = await browser.new_page(device_scale_factor=3)
-        abs_path = f"file:///{html_file_path.absolute()}"
-        
         await page.set_viewport_size({"width": 1000, "height": 2000}) # Height increased just in case
-        await page.goto(abs_path, wait_until="networkidle", timeout=120000)
-        
-        content_locator = page.locator(".infographic-container")
-        await page.evaluate("""
-            () => {
-                document.querySelector('.section:nth-of-type(4)').style.display = 'none';
-                document.querySelector('.section:nth-of-type(5)').style.display = 'none';
-                document.querySelector('.section:nth-of-type(6)').style.display = 'none';
-                document.querySelector('.footer').style.display = 'none';
-            }
-        """)
-        
-        part1_path = html_file_path.with_name(f"{html_file_path.stem}_part1.png")
-        await content_locator.screenshot(path=str(part1_path))
-        image_paths.append(part1_path)
-        print(f"[+] 截圖完成 Part 1: {part1_path.name}")
-
-        await page.evaluate("""
-            () => {
-                // Show clean slate (reset) or just toggle
-                document.querySelector('.section:nth-of-type(4)').style.display = 'block';
-                document.querySelector('.section:nth-of-type(5)').style.display = 'block';
-                document.querySelector('.section:nth-of-type(6)').style.display = 'block';
-                document.querySelector('.footer').style.display = 'block';
-
-                // Hide Part 1 elements
-                document.querySelector('.header').style.display = 'none';
-                document.querySelector('.section:nth-of-type(1)').style.display = 'none';
-                document.querySelector('.section:nth-of-type(2)').style.display = 'none';
-                document.querySelector('.section:nth-of-type(3)').style.display = 'none';
-            }
-        """)
-
-        part2_path = html_file_path.with_name(f"{html_file_path.stem}_part2.png")
-        await content_locator.screenshot(path=str(part2_path))
-        image_paths.append(part2_path)
-        print(f"[+] 截圖完成 Part 2: {part2_path.name}")
-        
+        image_paths = await _capture_parts(page, html_file_path)
         await browser.close()
-        
+
+    return image_paths
+
+async def _capture_parts(page, html_file_path):
+    image_paths = []
+    abs_path = f"file:///{html_file_path.absolute()}"
+    await page.goto(abs_path, wait_until="networkidle", timeout=120000)
+
+    content_locator = page.locator(".infographic-container")
+    await page.evaluate("""
+        () => {
+            document.querySelector('.section:nth-of-type(4)').style.display = 'none';
+            document.querySelector('.section:nth-of-type(5)').style.display = 'none';
+            document.querySelector('.section:nth-of-type(6)').style.display = 'none';
+            document.querySelector('.footer').style.display = 'none';
+        }
+    """)
+    
+    part1_path = html_file_path.with_name(f"{html_file_path.stem}_part1.png")
+    await content_locator.screenshot(path=str(part1_path))
+    image_paths.append(part1_path)
+    print(f"[+] 截圖完成 Part 1: {part1_path.name}")
+
+    await page.evaluate("""
+        () => {
+            // Show clean slate (reset) or just toggle
+            document.querySelector('.section:nth-of-type(4)').style.display = 'block';
+            document.querySelector('.section:nth-of-type(5)').style.display = 'block';
+            document.querySelector('.section:nth-of-type(6)').style.display = 'block';
+            document.querySelector('.footer').style.display = 'block';
+
+            // Hide Part 1 elements
+            document.querySelector('.header').style.display = 'none';
+            document.querySelector('.section:nth-of-type(1)').style.display = 'none';
+            document.querySelector('.section:nth-of-type(2)').style.display = 'none';
+            document.querySelector('.section:nth-of-type(3)').style.display = 'none';
+        }
+    """)
+
+    part2_path = html_file_path.with_name(f"{html_file_path.stem}_part2.png")
+    await content_locator.screenshot(path=str(part2_path))
+    image_paths.append(part2_path)
+    print(f"[+] 截圖完成 Part 2: {part2_path.name}")
+
     return image_paths
 
-async def send_to_telegram(image_paths, html_path):
-    """第四步：發送 圖片(多張) 和 HTML 到 Telegram"""
+async def send_to_telegram(image_paths, html_path, bot=None, sent=None, chat_id=None):
+    """第四步：發送 圖片(多張) 和 HTML 到 Telegram
+    若傳入已預熱 (initialize 過) 的 bot，直接沿用其連線池且不在此關閉。
+    sent: 已發送圖片的集合 (重試時跳過，避免重複發送)。
+    chat_id: 發送對象 (預設 TELEGRAM_CHAT_ID)"""
+    chat_id = chat_id or TELEGRAM_CHAT_ID
+    if not TELEGRAM_BOT_TOKEN or not chat_id:
+        print("[!] 錯誤：未設定 Telegram Token 或 Chat ID，略過發送步驟。")
+        return
+    if bot is not None:
+        await _send_photos(bot, image_paths, sent, chat_id)
+        return
+    bot = Bot(token=TELEGRAM_BOT_TOKEN)
+    async with bot:
+        await _send_photos(bot, image_paths, sent, chat_id)
+
+async def send_telegram_message(text):
+    """發送純文字訊息到 Telegram"""
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
         print("[!] 錯誤：未設定 Telegram Token 或 Chat ID，略過發送步驟。")
         return
     bot = Bot(token=TELEGRAM_BOT_TOKEN)
     async with bot:
-        # 發送圖片 (Loop)
-        for i, img_path in enumerate(image_paths):
-            caption = f"📊 美股日報 Part {i+1}"
-            with open(img_path, 'rb') as f:
-                await bot.send_photo(
-                    chat_id=TELEGRAM_CHAT_ID, 
-                    photo=f, 
-                    caption=caption,
-                    read_timeout=60, 
-                    write_timeout=60, 
-                    connect_timeout=60
-                )
-            print(f"[+] 圖片已發送: {img_path.name}")
-        
+        await bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=text)
+
+async def _send_photos(bot, image_paths, sent=None, chat_id=None):
+    # 發送圖片 (Loop)
+    for i, img_path in enumerate(image_paths):
+        if sent is not None and img_path in sent:
+            continue
+        caption = f"📊 美股日報 Part {i+1}"
+        with open(img_path, 'rb') as f:
+            await bot.send_photo(
+                chat_id=chat_id or TELEGRAM_CHAT_ID, 
+                photo=f, 
+                caption=caption,
+                read_timeout=60, 
+                write_timeout=60, 
+                connect_timeout=60
+            )
+        print(f"[+] 圖片已發送: {img_path.name}")
+        if sent is not None:
+            sent.add(img_path)
+
         # # 發送 HTML (維持 send_document)
         # with open(html_path, 'rb') as f:
         #     await bot.send_document(
@@ -293,18 +447,9 @@ async def send_to_telegram(image_paths, html_path):
         #     )
         # print(f"[+] HTML 已發送: {html_path.name}")
 
-async def generate_email_html(target_date, market_data, output_dir=None):
-    """第二步(B)：將數據填入 Email 版型 (Table Layout)"""
-    print("[*] 執行 Step 2B: 生成 Email HTML (Ghost)...")
-    
-    template_path = BASE_DIR / "prompts/email_template.html"
-    if not template_path.exists():
-        print(f"[!] 找不到 {template_path}，跳過 Ghost 生成。")
-        return None
-    
-    html_template = template_path.read_text(encoding="utf-8")
-    
-    generation_prompt = f"""
+def email_html_prompt(payload, html_template):
+    """建立生成 Email HTML 的指令"""
+    return f"""
 你是一位專業的 Email 行銷人員與前端工程師。
 請將下方的市場數據填入「Email HTML 版型」中。
 
@@ -333,35 +478,54 @@ async def generate_email_html(target_date, market_data, output_dir=None):
 
 ### [數據來源]
 **1. 指數 & 板塊:**
-{market_data.get('market_data_str', 'N/A')}
+{payload['market_data_str']}
 
 **2. 債券:**
-{market_data.get('treasury_result', 'N/A')}
+{payload['treasury']}
 
 **3. 市場回顧:**
-{json.dumps(market_data.get('recap_summary', []), indent=2, ensure_ascii=False)}
+{payload['recap']}
 
 **4. 焦點個股:**
-{json.dumps(market_data.get('biggest_change_sp500_stock', []), indent=2, ensure_ascii=False)}
+{payload['movers']}
 
 **5. 新聞摘要:**
-{json.dumps(market_data.get('symbol_news_summary', {}), indent=2, ensure_ascii=False)}
+{payload['news']}
 
 ---
 ### [Email版型]
 {html_template}
 """
+
+async def generate_email_html(target_date, snapshot, output_dir=None, incremental=False, stats=None):
+    """第二步(B)：將數據填入 Email 版型 (Table Layout)"""
+    print("[*] 執行 Step 2B: 生成 Email HTML (Ghost)...")
+    
     try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=generation_prompt
+        html_template = read_template("prompts/email_template.html")
+    except FileNotFoundError as e:
+        print(f"[!] {e}，跳過 Ghost 生成。")
+        return None
+    payload = format_market_payload(snapshot)
+    stats = stats if stats is not None else IncrementalStats()
+
+    full_prompt = email_html_prompt(payload, html_template)
+
+    async def render_full():
+        response = await asyncio.to_thread(generate_content, 'email_html', full_prompt)
+        return strip_code_fence(response.text)
+
+    async def render_section(number, fragment):
+        prompt = email_html_prompt(email_section_payloads(snapshot)[number], fragment) + SECTION_ONLY_NOTE
+        stats.section_prompt(estimate_tokens(prompt))
+        response = await asyncio.to_thread(generate_content, 'html_section', prompt)
+        return strip_code_fence(response.text)
+
+    try:
+        html_content = await render_incremental(
+            'email_html', html_template, email_section_inputs(snapshot), render_full, render_section,
+            render_cache, stats, enabled=incremental, full_prompt_tokens=estimate_tokens(full_prompt),
         )
-        html_content = response.text.strip()
-        if html_content.startswith("```html"):
-            html_content = html_content[7:]
-        if html_content.endswith("```"):
-            html_content = html_content[:-3]
-        html_content = html_content.strip()
         
         if output_dir:
             email_html_path = output_dir / f"email_report_{target_date.replace('/', '').replace(' ', '')}.html"
@@ -373,39 +537,245 @@ async def generate_email_html(target_date, market_data, output_dir=None):
         print(f"[!] 生成 Email HTML 失敗: {e}")
         return None
 
-async def run_automation(target_date=None):
+def archive_snapshot(snapshot, archive=None):
+    """存檔今日 snapshot，並列出與前一份存檔的差異 (直接比較數值，不需重新計算)"""
+    archive = archive or snapshot_archive
+    try:
+        path = archive.save(snapshot)
+        print(f"[+] Snapshot 已存檔: {path}")
+        previous = archive.previous(snapshot.date)
+    except Exception as e:
+        print(f"[!] Snapshot 存檔失敗: {e}")
+        return
+    if previous is not None:
+        diff = snapshot.diff(previous)
+        print(f"[*] 與 {diff['previous_date']} 相比：新進個股 {diff['movers_added']}、"
+              f"新聞變動 {len(diff['news_changed'])} 檔、市場回顧{'有' if diff['recap_changed'] else '無'}變動")
+
+def load_baseline(date, archive=None):
+    """增量模式的比較基準：同一天先前的存檔 (重跑時) 或前一份存檔"""
+    archive = archive or snapshot_archive
+    try:
+        return archive.load(date) or archive.previous(date)
+    except Exception as e:
+        print(f"[!] 無法讀取前一份 snapshot: {e}")
+        return None
+
+def summarize_movers_news(symbols, baseline, stats):
+    """個股新聞摘要；新聞集合 (去重後) 與基準相同的個股直接沿用其摘要
+    :return: (symbol -> 摘要, symbol -> 新聞指紋)"""
+    news_by_symbol = fmp_client.get_sp500_change_news_items(symbols)
+    previous = {n.symbol: n for n in baseline.news} if baseline is not None else {}
+    summaries, hashes = {}, {}
+    reused = []
+    for symbol, items in news_by_symbol.items():
+        fingerprint = news_fingerprint(items)
+        old = previous.get(symbol)
+        if items and old is not None and old.news_hash == fingerprint:
+            summaries[symbol] = old.summary
+            hashes[symbol] = fingerprint
+            reused.append(symbol)
+            stats.reused(estimate_tokens(format_news_items(items)))
+            continue
+        summary = summarize_company_news(symbol, items)
+        if items:
+            stats.called()
+        summaries[symbol] = summary
+        hashes[symbol] = "" if summary.startswith(SUMMARY_ERROR_PREFIX) else fingerprint
+    if baseline is not None:
+        print(f"   - 個股新聞摘要：沿用 {len(reused)} 檔 {reused}，重新生成 {len(summaries) - len(reused)} 檔")
+    return summaries, hashes
+
+def summarize_recap(recap_content, baseline, stats):
+    """市場回顧摘要；原文雜湊與基準相同時沿用前次摘要
+    :return: (RecapItem tuple, 原文雜湊)"""
+    recap_hash = content_hash(recap_content)
+    if baseline is not None and baseline.recap and baseline.recap_hash == recap_hash:
+        print("   - 市場回顧原文未變動，沿用前次摘要")
+        stats.reused(estimate_tokens(truncate(recap_content, FIELD_BUDGETS['recap_content'])))
+        return baseline.recap, recap_hash
+    recap = MarketSnapshot.recap_from_list(summarize_market_recap(recap_content))
+    stats.called()
+    return recap, recap_hash if recap else ""
+
+async def collect_snapshot(report_date, market_data, movers_list, baseline, stats):
+    """個股新聞摘要 (每檔一次) 與市場回顧，連同市場數據彙整為不可變的 snapshot
+    :param market_data: fetch_market_data() 的結果
+    :param movers_list: FMP 格式的個股列表 (symbol / changesPercentage / price / type)"""
+    indices, sectors, treasury = market_data
+    movers_list = movers_list or []
+    movers_symbols = list(dict.fromkeys(item['symbol'] for item in movers_list))
+    symbol_news_summary, news_hashes = {}, {}
+    if movers_symbols:
+        symbol_news_summary, news_hashes = summarize_movers_news(movers_symbols, baseline, stats)
+    # print(symbol_news_summary)
+
+    print("[*] Scraping Market Recap...")
+    recap_content = await get_market_recap_content()
+    recap, recap_hash = (), ""
+    if recap_content:
+        recap, recap_hash = summarize_recap(recap_content, baseline, stats)
+    else:
+        print("[!] Market recap scraping failed or empty.")
+
+    return MarketSnapshot(
+        date=report_date,
+        indices=indices,
+        sectors=sectors,
+        treasury=treasury,
+        movers=MarketSnapshot.movers_from_list(movers_list),
+        news=MarketSnapshot.news_from_dict(symbol_news_summary, news_hashes),
+        recap=recap,
+        recap_hash=recap_hash,
+    )
+
+async def with_retries(name, branch, attempts=PUBLISH_ATTEMPTS, delay=PUBLISH_RETRY_DELAY):
+    """執行單一發佈管道並在失敗時重試；branch 需自行保存進度，使重試只補做未完成的步驟"""
+    for attempt in range(1, attempts + 1):
+        try:
+            return await branch()
+        except Exception as e:
+            print(f"[!] [{name}] 第 {attempt}/{attempts} 次失敗: {e}")
+            if attempt == attempts:
+                raise
+            await asyncio.sleep(delay)
+
+def telegram_branch(target_date, snapshot, temp_dir, warm=None, triggered_at=None, images_ready=None,
+                    incremental=False, stats=None):
+    """Telegram 管道：HTML -> 圖片 -> 發送 (重試時沿用已完成的 HTML / 圖片 / 已發送的圖片)
+    images_ready: 圖片完成時設定結果的 Future，供 Ghost 管道上傳使用"""
+    progress = {'html': None, 'images': None, 'sent': set()}
+
+    async def run():
+        if progress['html'] is None:
+            progress['html'] = await generate_html(target_date, snapshot, output_dir=temp_dir, incremental=incremental, stats=stats)
+        if progress['images'] is None:
+            progress['images'] = await convert_to_images(progress['html'], page=warm.page if warm else None)
+            if images_ready is not None and not images_ready.done():
+                images_ready.set_result(progress['images'])
+        await send_to_telegram(progress['images'], progress['html'], bot=warm.bot if warm else None, sent=progress['sent'])
+        if triggered_at is not None:
+            print(f"[⏱] 觸發至 Telegram 發送完成耗時 {time.monotonic() - triggered_at:.1f} 秒 ({'預熱' if warm else '冷啟動'})")
+        return progress['images']
+
+    return run
+
+def ghost_branch(target_date, snapshot, temp_dir, images_ready=None, incremental=False, stats=None):
+    """Ghost 管道：Email HTML -> 上傳報告圖片 -> 以 slug upsert 草稿
+    (重試時沿用已生成的 HTML 與已上傳的圖片；同一天重跑只會更新同一篇草稿，已發佈的文章預設不覆寫)"""
+    ghost_url = os.getenv("API_URL")
+    # ghost_url path is handled in GhostClient
+    ghost_key = os.getenv("ADMIN_API")
+    date_key = target_date.replace('/', '').replace(' ', '')
+    progress = {'html': None, 'image_urls': None}
+
+    async def run():
+        if progress['html'] is None:
+            progress['html'] = await generate_email_html(target_date, snapshot, output_dir=temp_dir, incremental=incremental, stats=stats)
+            if not progress['html']:
+                raise RuntimeError("Email HTML 生成失敗")
+
+        print(f"[*] 發送至 Ghost (URL: {ghost_url})...")
+        async with AsyncGhostClient(ghost_url, ghost_key) as ghost:
+            if progress['image_urls'] is None and images_ready is not None:
+                try:
+                    image_paths = await asyncio.wait_for(asyncio.shield(images_ready), GHOST_IMAGE_WAIT)
+                except asyncio.TimeoutError:
+                    image_paths = None
+                if image_paths:
+                    progress['image_urls'] = await ghost.upload_images(image_paths)
+                    print(f"[+] 已上傳 {len(progress['image_urls'])} 張圖片至 Ghost")
+                else:
+                    print("[!] 報告圖片未就緒，Ghost 文章將不含圖片。")
+                    progress['image_urls'] = []
+
+            image_urls = progress['image_urls'] or []
+            post = await ghost.upsert_post(
+                f"market-report-{date_key}",
+                f"美國市場收盤報告 {target_date}",
+                embed_images(progress['html'], image_urls),
+                status='draft',
+                overwrite_published=GHOST_OVERWRITE_PUBLISHED,
+                tags=['Market Report'],
+                feature_image=image_urls[0] if image_urls else None,
+            )
+        if post.get('status') == 'published' and not GHOST_OVERWRITE_PUBLISHED:
+            print(f"[!] Ghost 文章已發佈，略過更新 (設定 GHOST_OVERWRITE_PUBLISHED=1 可覆寫): {post.get('title')}")
+            return post
+        print(f"[+] Ghost 文章發布成功: {post.get('title')}")
+        return post
+
+    return run
+
+async def publish_all(target_date, snapshot, temp_dir, warm=None, triggered_at=None, incremental=False, stats=None):
+    """Telegram 與 Ghost 兩個管道同時執行、各自重試；一個管道失敗不影響另一個"""
+    images_ready = asyncio.get_running_loop().create_future()
+    branches = {'telegram': telegram_branch(
+        target_date, snapshot, temp_dir, warm=warm, triggered_at=triggered_at, images_ready=images_ready,
+        incremental=incremental, stats=stats,
+    )}
+    if os.getenv("API_URL") and os.getenv("ADMIN_API"):
+        branches['ghost'] = ghost_branch(target_date, snapshot, temp_dir, images_ready=images_ready, incremental=incremental, stats=stats)
+    else:
+        print("[!] 未設定 API_URL 或 ADMIN_API，跳過 Ghost 發送。")
+
+    async def run_branch(name, branch):
+        try:
+            return await with_retries(name, branch)
+        finally:
+            # Telegram 管道結束 (含失敗) 時解除 Ghost 管道的等待
+            if name == 'telegram' and not images_ready.done():
+                images_ready.set_result(None)
+
+    started = time.monotonic()
+    results = await asyncio.gather(
+        *(run_branch(name, branch) for name, branch in branches.items()),
+        return_exceptions=True,
+    )
+    print(f"[⏱] 發佈階段耗時 {time.monotonic() - started:.1f} 秒")
+
+    failed = [name for name, result in zip(branches, results) if isinstance(result, BaseException)]
+    for name, result in zip(branches, results):
+        if isinstance(result, BaseException):
+            print(f"[❌] [{name}] 發佈失敗: {result}")
+    return failed
+
+async def run_automation(target_date=None, warm=None, triggered_at=None, deadline_minutes=RUN_DEADLINE_MINUTES,
+                         incremental=None):
+    """
+    執行完整流程。
+    :param warm: 排程預熱產生的 WarmContext (可為 None，則以冷啟動方式執行)
+    :param triggered_at: 觸發時間 (time.monotonic())，用於記錄觸發至 Telegram 發送的延遲
+    :param deadline_minutes: 本次執行的時間預算，傳遞至每一個 LLM 呼叫
+    :param incremental: 是否以增量模式執行 (None = 依 INCREMENTAL 設定)
+    :return: 是否所有步驟與發佈管道皆成功
+    """
+    if triggered_at is None:
+        triggered_at = time.monotonic()
     if not target_date:
         target_date = datetime.datetime.now().strftime("%Y / %m / %d")
+    if incremental is None:
+        incremental = INCREMENTAL
+    stats = IncrementalStats()
+    deadline_token = enter_deadline(deadline_minutes * 60)
     try:
+        report_date = report_date_iso(target_date)
+        baseline = load_baseline(report_date) if incremental else None
+        if baseline is not None:
+            print(f"[*] 增量模式：以 {baseline.date} 的 snapshot 為比較基準")
+        elif incremental:
+            print("[!] 增量模式：找不到先前的 snapshot，完整生成。")
+
         # 0. 獲取 FMP 數據
         print("======== [Step 0: Fetching Data] ========")
-        market_data_str, treasury_result = fetch_market_data()
+        market_data = fetch_market_data()
         
         print("[*] Fetching biggest movers...")
         biggest_change_sp500_stock = fmp_client.get_biggest_change_sp500_stock()
         
-        movers_symbols = [item['symbol'] for item in biggest_change_sp500_stock] if biggest_change_sp500_stock else []
-        symbol_news_summary = {}
-        if movers_symbols:
-            symbol_news_summary = fmp_client.get_sp500_change_news(movers_symbols)
-        # print(symbol_news_summary)
-        
-        print("[*] Scraping Market Recap...")
-        recap_content = await get_market_recap_content()
-        recap_summary = []
-        if recap_content:
-            recap_summary = summarize_market_recap(recap_content)
-        else:
-            print("[!] Market recap scraping failed or empty.")
-
-        # 彙整所有數據
-        all_market_data = {
-            'market_data_str': market_data_str,
-            'treasury_result': treasury_result,
-            'biggest_change_sp500_stock': biggest_change_sp500_stock,
-            'symbol_news_summary': symbol_news_summary,
-            'recap_summary': recap_summary
-        }
+        # 彙整所有數據為不可變的 snapshot，並依日期存檔
+        snapshot = await collect_snapshot(report_date, market_data, biggest_change_sp500_stock, baseline, stats)
+        archive_snapshot(snapshot)
         print("======== [Data Collection Complete] ========")
 
         # 1. 使用 tempfile 處理中間產物
@@ -414,92 +784,436 @@ async def run_automation(target_date=None):
             print(f"[*] 使用暫存目錄: {temp_dir}")
 
             # (Optional) 這裡可以選擇是否要將 md 存檔，或只是為了 debug
-            # await analyze_market(target_date, market_data_str, treasury_result, output_dir=temp_dir)
-
-            # 生成 Telegram 用 HTML (Grid Layout) -> Images (Split)
-            tg_html_file = await generate_html(target_date, all_market_data, output_dir=temp_dir)
-            image_files = await convert_to_images(tg_html_file)
-            await send_to_telegram(image_files, tg_html_file)
-            
-            # 2. 生成 Ghost 用 HTML (Table Layout) -> Post
-            # email_html_content = await generate_email_html(target_date, all_market_data, output_dir=temp_dir)
-            
-            # if email_html_content:
-            #     ghost_url = os.getenv("API_URL")
-            #     # ghost_url path is handled in GhostClient
-            #     ghost_key = os.getenv("ADMIN_API")
-                
-            #     if ghost_url and ghost_key:
-            #         print(f"[*] 發送至 Ghost (URL: {ghost_url})...")
-            #         ghost = GhostClient(ghost_url, ghost_key)
-            #         title = f"美國市場收盤報告 {target_date}"
-                    
-            #         # Create Post (Status='draft')
-            #         result = ghost.create_post(
-            #             title, 
-            #             email_html_content, 
-            #             status='draft', 
-            #             tags=['Market Report']
-            #         )
-            #         if result:
-            #             print(f"[+] Ghost 文章發布成功: {result.get('posts', [{}])[0].get('title')}")
-            #         else:
-            #             print("[!] Ghost 文章發布失敗")
-            #     else:
-            #         print("[!] 未設定 API_URL 或 ADMIN_API，跳過 Ghost 發送。")
+            # await analyze_market(target_date, snapshot.market_data_str, snapshot.treasury, output_dir=temp_dir)
+
+            # Telegram (Grid Layout -> Images) 與 Ghost (Table Layout -> Post) 同時從同一份快照發佈
+            failed = await publish_all(
+                target_date, snapshot, temp_dir, warm=warm, triggered_at=triggered_at,
+                incremental=incremental, stats=stats,
+            )
 
+        if failed:
+            print(f"\n[!] 部分管道發佈失敗: {failed} (暫存檔案已清除)")
+            return False
         print("\n 全流程執行成功！(暫存檔案已清除)")
+        return True
         
     except Exception as e:
         print(f"\n[❌] 執行過程中發生錯誤: {e}")
         import traceback
         traceback.print_exc()
+        return False
+    finally:
+        exit_deadline(deadline_token)
+        print(f"[*] 本次{'增量' if incremental else '完整'}執行：{stats.summary()}")
+        for stage, usage in token_report().items():
+            print(f"   [tokens] {stage}: {usage['calls']} 次，估計 {usage['estimated']} / 實際輸入 {usage['prompt_tokens']} / 輸出 {usage['output_tokens']}")
 
-async def scheduler():
-    """排程模式：每天 06:00 執行"""
-    
-    while True:
-        # 使用 Asia/Taipei 時區
-        tz = ZoneInfo("Asia/Taipei")
-        now = datetime.datetime.now(tz)
-        
-        # 設定目標時間為今天的 05:55 (台北時間)
-        target_time = now.replace(hour=5, minute=55, second=0, microsecond=0)
-        
-        # 如果現在已經過了 06:00，目標設為明天 06:00
-        if now >= target_time:
-            target_time += datetime.timedelta(days=1)
-            
-        wait_seconds = (target_time - now).total_seconds()
-        hours = int(wait_seconds // 3600)
-        minutes = int((wait_seconds % 3600) // 60)
-        
-        print(f"\n[*] 目前時間: {now.strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"[*] 下次執行: {target_time.strftime('%Y-%m-%d %H:%M:%S')} (還有 {hours} 小時 {minutes} 分鐘)")
-        
-        # 等待直到目標時間
-        await asyncio.sleep(wait_seconds)
-        
-        print(f"\n[⏰] 時間到！開始執行任務: {datetime.datetime.now(tz).strftime('%Y-%m-%d')}")
-        
-        # 檢查是否為週日 (6) 或週一 (0) -> 對應美股的週六與週日休市
-        current_weekday = datetime.datetime.now(tz).weekday()
-        if current_weekday in [0, 6]:
-            print(f"[!] 今日是 {'週一' if current_weekday == 0 else '週日'} (美股週末休市)，跳過執行。")
-            continue
+# 非原始語言的版本：附加於預設 prompt 之後
+LANGUAGE_NOTE = """
+### [輸出語言]
+報告中的所有文字 (標題、標籤、摘要) 請使用「{language}」，取代上方「繁體中文」的要求。
+"""
+
+def variant_prompt_builder(variant):
+    """版本的 prompt：自訂 prompt 檔 (以 {placeholder} 填入數據) 或預設 prompt 加上語言要求"""
+    if variant.prompt:
+        prompt_text = read_template(variant.prompt)
+        return lambda target_date, payload, html_template: fill_prompt(
+            prompt_text, {**payload, 'target_date': target_date, 'language': variant.language, 'html_template': html_template},
+        )
+    note = "" if variant.language == SOURCE_LANGUAGE else LANGUAGE_NOTE.format(language=variant.language)
+    return lambda target_date, payload, html_template: tg_html_prompt(target_date, payload, html_template) + note
+
+async def publish_variant(variant, target_date, shared, movers, temp_dir, bot, translator, renders, render_slots,
+                          incremental=False, stats=None, browser=None, images_ready=None):
+    """單一版本：篩選個股 -> 翻譯 -> 渲染 (相同輸入的版本共用一次渲染與截圖) -> 發送至該版本的 chat ID
+    browser：預熱的瀏覽器 (None = 每次截圖自行啟動)
+    images_ready：圖片完成時設定結果的 Future，供 Ghost 管道上傳使用"""
+    snapshot = await translator.translate_snapshot(variant_snapshot(shared, movers), variant.language)
+    template_text = read_template(variant.template)
+    prompt_text = read_template(variant.prompt) if variant.prompt else variant.language
+    render_key = content_hash(variant.template, template_text, prompt_text, variant.language, snapshot)
+
+    async def render():
+        output_dir = temp_dir / render_key
+        output_dir.mkdir(exist_ok=True)
+        html_file = await generate_html(
+            target_date, snapshot, output_dir, incremental=incremental, stats=stats,
+            template_path=variant.template, build_prompt=variant_prompt_builder(variant),
+            cache_kind=f"tg_html-{variant.render_profile}",
+            budgets=FIELD_BUDGETS if variant.language == SOURCE_LANGUAGE else TRANSLATED_BUDGETS,
+        )
+        async with render_slots:
+            return await convert_to_images(html_file, browser=browser)
+
+    image_paths = await renders.run(render_key, render)
+    if images_ready is not None and not images_ready.done():
+        images_ready.set_result(image_paths)
+    sent = set()
+    await with_retries(variant.name, lambda: send_to_telegram(image_paths, None, bot=bot, sent=sent, chat_id=variant.chat_id))
+    print(f"[+] [{variant.name}] 已發送至 {variant.chat_id} ({len(movers)} 檔個股，{variant.language})")
+
+async def run_variants(target_date=None, variants=None, incremental=None, deadline_minutes=RUN_DEADLINE_MINUTES,
+                       warm=None):
+    """
+    多版本報告：每個 universe 只收集一次數據 (市場數據、完整報價、所有版本個股的新聞摘要、市場回顧)，
+    各版本的篩選、翻譯、渲染與發送則在共用的 snapshot 上同時進行。
+    Ghost 文章由預設版本 (原文語言、無 watchlist 的 sp500 版本，即原本的早報) 發佈。
+    :param variants: ReportVariant 列表 (None = 讀取 REPORT_VARIANTS 設定檔)
+    :param warm: 排程預熱產生的 WarmContext (沿用其 Telegram 連線池與瀏覽器)
+    :return: 失敗的版本名稱 (Ghost 失敗時含 'ghost')
+    """
+    if not target_date:
+        target_date = datetime.datetime.now().strftime("%Y / %m / %d")
+    if incremental is None:
+        incremental = INCREMENTAL
+    if variants is None:
+        variants = load_variants(REPORT_VARIANTS)
+    if not variants:
+        print("[!] 沒有設定任何報告版本。")
+        return []
+
+    stats = IncrementalStats()
+    translator = Translator()
+    renders = SharedTasks()
+    render_slots = asyncio.Semaphore(VARIANT_RENDER_CONCURRENCY)
+    report_date = report_date_iso(target_date)
+    failed = []
+    deadline_token = enter_deadline(deadline_minutes * 60)
+    try:
+        print(f"======== [Variants: {len(variants)} 個版本] ========")
+        market_data = fetch_market_data()
+        by_universe = {}
+        for variant in variants:
+            by_universe.setdefault(variant.universe, []).append(variant)
+
+        # 所有版本共用同一個 Bot 連線池 (預熱時已建立則直接沿用，且不在此關閉)
+        owns_bot = not (warm and warm.bot)
+        bot = warm.bot if not owns_bot else None
+        if owns_bot and TELEGRAM_BOT_TOKEN:
+            bot = Bot(token=TELEGRAM_BOT_TOKEN)
+            await bot.initialize()
+        try:
+            with tempfile.TemporaryDirectory() as temp_dir_str:
+                for universe, group in by_universe.items():
+                    failed += await publish_universe(
+                        universe, group, target_date, report_date, market_data, Path(temp_dir_str), bot,
+                        translator, renders, render_slots, incremental=incremental, stats=stats,
+                        browser=warm.browser if warm else None,
+                    )
+        finally:
+            if owns_bot and bot is not None:
+                await bot.shutdown()
+
+        print(f"\n[*] {len(variants)} 個版本：渲染 {len(renders)} 次 (共用 {renders.hits} 次)，"
+              f"翻譯呼叫 {translator.calls} 次 ({translator.translated} 段，沿用 {translator.reused} 段)，失敗 {failed or '無'}")
+    except Exception as e:
+        print(f"\n[❌] 執行過程中發生錯誤: {e}")
+        import traceback
+        traceback.print_exc()
+        failed = [v.name for v in variants]
+    finally:
+        exit_deadline(deadline_token)
+        print(f"[*] {stats.summary()}")
+        for stage, usage in token_report().items():
+            print(f"   [tokens] {stage}: {usage['calls']} 次，估計 {usage['estimated']} / 實際輸入 {usage['prompt_tokens']} / 輸出 {usage['output_tokens']}")
+    return failed
+
+def universe_archive(universe):
+    """多版本報告中每個 universe 的 snapshot 存檔目錄"""
+    return SnapshotArchive(snapshot_archive.root / f"universe-{universe}")
+
+def ghost_variant(variants):
+    """發佈 Ghost 文章的預設版本：原文語言、無 watchlist 的 sp500 版本 (與原本的早報相同)"""
+    return next((v for v in variants if v.universe == "sp500" and not v.watchlist and v.language == SOURCE_LANGUAGE), None)
+
+async def publish_universe(universe, group, target_date, report_date, market_data, temp_dir, bot, translator,
+                           renders, render_slots, incremental=False, stats=None, browser=None):
+    """一個 universe：收集一次數據 (新聞摘要只針對所有版本個股的聯集，每檔一次)，再同時發佈各版本
+    以及預設版本的 Ghost 文章 (設定 API_URL 與 ADMIN_API 時)
+    :return: 失敗的版本名稱 (Ghost 失敗時為 'ghost')"""
+    archive = universe_archive(universe)
+    baseline = load_baseline(report_date, archive) if incremental else None
+    quotes = fmp_client.get_sp500_quotes()
+    movers_by_variant = {
+        v.name: fmp_client.rank_movers(filter_quotes(quotes, v.watchlist), v.movers) for v in group
+    }
+    union = list({item['symbol']: item for items in movers_by_variant.values() for item in items}.values())
+    print(f"[*] [{universe}] {len(group)} 個版本共 {len(union)} 檔不重複個股")
+    shared = await collect_snapshot(report_date, market_data, union, baseline, stats)
+    archive_snapshot(shared, archive)
+
+    ghost_source = None
+    if os.getenv("API_URL") and os.getenv("ADMIN_API"):
+        ghost_source = ghost_variant(group)
+        if ghost_source is None:
+            print(f"[!] [{universe}] 沒有原文語言、無 watchlist 的 sp500 版本，跳過 Ghost 發送。")
+    images_ready = asyncio.get_running_loop().create_future()
+
+    async def run_variant(v):
+        try:
+            return await publish_variant(
+                v, target_date, shared, MarketSnapshot.movers_from_list(movers_by_variant[v.name]), temp_dir,
+                bot, translator, renders, render_slots, incremental=incremental, stats=stats, browser=browser,
+                images_ready=images_ready if v is ghost_source else None,
+            )
+        finally:
+            # 預設版本結束 (含失敗) 時解除 Ghost 管道的等待
+            if v is ghost_source and not images_ready.done():
+                images_ready.set_result(None)
+
+    names = [v.name for v in group]
+    tasks = [run_variant(v) for v in group]
+    if ghost_source is not None:
+        ghost_snapshot = variant_snapshot(shared, MarketSnapshot.movers_from_list(movers_by_variant[ghost_source.name]))
+        names.append('ghost')
+        tasks.append(with_retries('ghost', ghost_branch(
+            target_date, ghost_snapshot, temp_dir, images_ready=images_ready, incremental=incremental, stats=stats,
+        )))
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    failed = []
+    for name, result in zip(names, results):
+        if isinstance(result, BaseException):
+            print(f"[❌] [{name}] 發佈失敗: {result}")
+            failed.append(name)
+    return failed
+
+async def warm_up_pipeline():
+    """預熱：預載成分股與版型、建立 FMP/Gemini/Telegram 連線、啟動瀏覽器並預先載入版型"""
+    print("[*] 開始預熱...")
+    template_path = BASE_DIR / "prompts/tg_template.html"
+    return await warm_up(
+        fmp_client,
+        client,
+        MODEL_NAME,
+        telegram_token=TELEGRAM_BOT_TOKEN if TELEGRAM_CHAT_ID else None,
+        page_url=f"file:///{template_path.absolute()}",
+        preload=(
+            fmp_client.load_sp500_symbols,
+            lambda: read_template("prompts/tg_template.html"),
+            lambda: read_template("prompts/email_template.html"),
+        ),
+    )
+
+async def run_intraday_snapshot():
+    """盤中快照：以批次報價取得 S&P 500 最大漲跌個股並發送文字訊息"""
+    movers = fmp_client.get_biggest_change_sp500_stock()
+    if not movers:
+        print("[!] 無法取得盤中報價，略過。")
+        return
+    now_ny = datetime.datetime.now(ZoneInfo("America/New_York"))
+    lines = [f"⏱ 盤中快照 {now_ny.strftime('%Y-%m-%d %H:%M')} (ET)"]
+    for label in ('Top Gainer', 'Top Loser'):
+        lines.append("📈 漲幅最大" if label == 'Top Gainer' else "📉 跌幅最大")
+        for item in movers:
+            if item['type'] == label:
+                lines.append(f"  {item['symbol']}: {item['price']} ({item['changesPercentage']:+.2f}%)")
+    await send_telegram_message("\n".join(lines))
+
+async def run_weekly_recap():
+    """每週回顧：主要指數與板塊 ETF 的週漲跌幅"""
+    lines = ["🗓 美股每週回顧"]
+    for title, symbols in (("主要指數", MARKET_SYMBOLS), ("板塊 ETF", SECTOR_ETF_MAP)):
+        lines.append(f"【{title}】")
+        for name, symbol in symbols.items():
+            try:
+                price, change = fmp_client.get_weekly_change(symbol)
+            except Exception as e:
+                print(f"   [!] 無法獲取 {name} ({symbol}): {e}")
+                price, change = None, None
+            change_str = f"{change:+.2f}%" if change is not None else "N/A"
+            lines.append(f"  {name}: {price if price is not None else 'N/A'} ({change_str})")
+    await send_telegram_message("\n".join(lines))
+
+async def run_intraday_stream(interval=60, replay=None, record=None, top_k=6, rank_threshold=2):
+    """盤中串流模式：輪詢批次報價 (或重播錄製檔)，僅在前/後 k 名成員或排名明顯變動時發送提醒"""
+    if replay:
+        print(f"[*] 重播盤中報價: {replay}")
+        feed = ReplayFeed(replay)
+    else:
+        now_ny = datetime.datetime.now(ZoneInfo("America/New_York"))
+        market_close = now_ny.replace(hour=16, minute=0, second=0, microsecond=0)
+        symbols = fmp_client.load_sp500_symbols()
+        print(f"[*] 盤中輪詢 {len(symbols)} 檔，每 {interval} 秒，至 {market_close.strftime('%H:%M')} (ET)")
+        feed = FMPQuotePoller(fmp_client, symbols, interval=interval, stop_at=market_close)
+    if record:
+        feed = record_feed(feed, record)
+    await run_intraday(feed, send_telegram_message, k=top_k, rank_threshold=rank_threshold)
+
+async def run_isolated(target_date, variants=False):
+    """在獨立子程序中執行一次完整流程 (variants=True 時為多版本報告)；子程序結束時其所有資源 (含洩漏) 一併釋放。
+    資源稽核在子程序內進行，結果以 JSON 行回報並加入 ResourceAudit.history"""
+    args = [sys.executable, str(BASE_DIR / "main.py"), "--date", target_date, "--audit"]
+    if variants:
+        args += ["--variants", str(REPORT_VARIANTS)]
+    if INCREMENTAL:
+        args.append("--incremental")
+    env = {**os.environ, "PYTHONUNBUFFERED": "1"}  # 即時轉送子程序的輸出
+    process = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, env=env)
+    report = None
+    async for raw in process.stdout:
+        line = raw.decode("utf-8", errors="replace")
+        parsed = parse_report_line(line.rstrip("\n"))
+        if parsed is None:
+            sys.stdout.write(line)
+        else:
+            report = parsed
+    returncode = await process.wait()
+    if report is not None:
+        ResourceAudit.history.append(report)
+    if returncode != 0:
+        raise RuntimeError(f"子程序執行失敗 (exit code {returncode})")
+
+def run_once(label, run, audit=False):
+    """單次任務模式：run() 回傳是否成功；audit=True 時稽核本次資源使用並以 JSON 行輸出。失敗時以 exit code 1 結束"""
+    if audit:
+        with ResourceAudit(label) as resource_audit:
+            succeeded = run()
+        print(format_report_line(resource_audit.report), flush=True)
+    else:
+        succeeded = run()
+    if not succeeded:
+        sys.exit(1)
+
+def _report_archived(fire_time, archive=None):
+    """該次排程的 snapshot 是否已存檔 (沒有排程狀態時，用以判斷是否需要補跑)"""
+    return (archive or snapshot_archive).path_for(fire_time.date().isoformat()).exists()
+
+async def _morning_report_job(fire_time, warm, isolate=False):
+    target_date = fire_time.strftime("%Y / %m / %d")
+    if isolate:
+        await run_isolated(target_date)
+        return
+    with ResourceAudit(f"morning_report {target_date}"):
+        succeeded = await run_automation(target_date=target_date, warm=warm, triggered_at=time.monotonic())
+    if not succeeded:
+        raise RuntimeError("早報執行失敗")
+
+def _variants_archived(fire_time):
+    return _report_archived(fire_time, universe_archive("sp500"))
+
+async def _variant_reports_job(fire_time, warm, isolate=False):
+    target_date = fire_time.strftime("%Y / %m / %d")
+    if isolate:
+        await run_isolated(target_date, variants=True)
+        return
+    with ResourceAudit(f"variant_reports {target_date}"):
+        failed = await run_variants(target_date=target_date, warm=warm)
+    if failed:
+        raise RuntimeError(f"部分版本發送失敗: {failed}")
+
+async def _intraday_snapshot_job(fire_time, context):
+    await run_intraday_snapshot()
+
+async def _weekly_recap_job(fire_time, context):
+    await run_weekly_recap()
+
+def build_jobs(warmup_minutes=WARMUP_MINUTES, isolate=RUN_ISOLATED):
+    """可用的排程工作 (名稱 -> Job)
+    isolate=True 時早報 / 多版本報告於子程序執行；預熱的連線無法跨程序共用，因此停用預熱。"""
+    taipei = ZoneInfo("Asia/Taipei")
+    return {
+        # 台北 05:55 = 前一個美股交易日收盤後；休市日 (含美國假日) 自動跳過
+        "morning_report": Job(
+            name="morning_report",
+            cron=CronSpec("55 5 * * *"),
+            func=lambda fire_time, warm: _morning_report_job(fire_time, warm, isolate=isolate),
+            tz=taipei,
+            warmup=datetime.timedelta(minutes=warmup_minutes),
+            prepare=warm_up_pipeline if warmup_minutes > 0 and not isolate else None,
+            completed=_report_archived,
+        ),
+        # 多版本報告 (REPORT_VARIANTS)，與早報同一時間；取代早報 (預設版本發佈 Ghost)，兩者不可同時啟用
+        "variant_reports": Job(
+            name="variant_reports",
+            cron=CronSpec("55 5 * * *"),
+            func=lambda fire_time, warm: _variant_reports_job(fire_time, warm, isolate=isolate),
+            tz=taipei,
+            warmup=datetime.timedelta(minutes=warmup_minutes),
+            prepare=warm_up_pipeline if warmup_minutes > 0 and not isolate else None,
+            completed=_variants_archived,
+        ),
+        # 美東盤中每 30 分鐘
+        "intraday_snapshot": Job(
+            name="intraday_snapshot",
+            cron=CronSpec("0,30 10-15 * * 1-5"),
+            func=_intraday_snapshot_job,
+            tz=ZoneInfo("America/New_York"),
+            catch_up=datetime.timedelta(minutes=20),
+        ),
+        # 台北週六早上 (美股週五收盤後)
+        "weekly_recap": Job(
+            name="weekly_recap",
+            cron=CronSpec("0 8 * * 6"),
+            func=_weekly_recap_job,
+            tz=taipei,
+            trading_days_only=False,
+            catch_up=datetime.timedelta(hours=24),
+        ),
+    }
+
+async def scheduler(warmup_minutes=WARMUP_MINUTES, job_names=SCHEDULER_JOBS, isolate=RUN_ISOLATED):
+    """排程模式：依交易日曆執行多個工作，重啟後補跑錯過的一次，並避免重疊執行"""
+    available = build_jobs(warmup_minutes, isolate=isolate)
+    names = [name.strip() for name in job_names.split(",") if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValueError(f"未知的排程工作: {unknown} (可用: {list(available)})")
+    # 兩者同一時間執行：同時啟用會把數據收集與 LLM 摘要做兩次，且預設版本會重複發送早報
+    if {"morning_report", "variant_reports"} <= set(names):
+        raise ValueError("morning_report 與 variant_reports 不可同時啟用；"
+                         "改用 variant_reports 時，請在 REPORT_VARIANTS 中設定原本早報的 chat ID 作為預設版本")
+    if "variant_reports" in names and os.getenv("API_URL") and os.getenv("ADMIN_API") \
+            and ghost_variant(load_variants(REPORT_VARIANTS)) is None:
+        print(f"[!] {REPORT_VARIANTS} 沒有原文語言、無 watchlist 的 sp500 版本，variant_reports 不會發佈 Ghost 文章。")
 
-        await run_automation()
+    print(f"[*] 啟用排程工作: {names} (狀態檔: {SCHEDULER_STATE})")
+    await JobScheduler([available[name] for name in names], SCHEDULER_STATE).run()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="美股分析自動化機器人")
-    parser.add_argument("--schedule", action="store_true", help="啟用排程模式 (每天早上 6:00 執行)")
+    parser.add_argument("--schedule", action="store_true", help="啟用排程模式 (每天早上 05:55 執行)")
+    parser.add_argument("--jobs", default=SCHEDULER_JOBS, help="排程模式啟用的工作，逗號分隔 (morning_report, variant_reports, intraday_snapshot, weekly_recap；morning_report 與 variant_reports 互斥)")
+    parser.add_argument("--warmup-minutes", type=float, default=WARMUP_MINUTES, help="排程模式下於目標時間前幾分鐘開始預熱 (0 = 停用)")
+    parser.add_argument("--isolate", action="store_true", default=RUN_ISOLATED, help="排程模式：每次早報 / 多版本報告於獨立子程序執行")
+    parser.add_argument("--date", help="單次任務模式的報告日期 (格式 2025 / 12 / 01)")
+    parser.add_argument("--audit", action="store_true", help="單次任務 / 多版本報告模式：稽核本次執行的資源使用，並以 JSON 行輸出 (供 --isolate 的父程序讀取)")
+    parser.add_argument("--incremental", action="store_true", default=INCREMENTAL, help="增量模式：沿用未變動的摘要與 HTML 區塊")
+    parser.add_argument("--variants", nargs="?", const=str(REPORT_VARIANTS), help="多版本報告模式 (可指定設定檔，預設 REPORT_VARIANTS)")
+    parser.add_argument("--intraday", action="store_true", help="盤中串流模式 (最大漲跌個股異動提醒)")
+    parser.add_argument("--interval", type=float, default=60, help="盤中模式輪詢間隔 (秒)")
+    parser.add_argument("--replay", help="盤中模式：重播錄製的報價檔 (JSON lines)")
+    parser.add_argument("--record", help="盤中模式：將收到的報價錄製到檔案")
+    parser.add_argument("--top-k", type=int, default=6, help="盤中模式追蹤的前/後名數")
+    parser.add_argument("--rank-threshold", type=int, default=2, help="盤中模式：成員或排名變動超過此名次才發送提醒 (新進榜需達第 k - 門檻 名以內)")
     args = parser.parse_args()
+    INCREMENTAL = args.incremental
 
     try:
         if args.schedule:
-            asyncio.run(scheduler())
+            asyncio.run(scheduler(warmup_minutes=args.warmup_minutes, job_names=args.jobs, isolate=args.isolate))
+        elif args.variants:
+            print(f"[*] 執行多版本報告模式 ({args.variants})...")
+            run_once(
+                f"variant_reports {args.date or 'today'}",
+                lambda: not asyncio.run(run_variants(target_date=args.date, variants=load_variants(args.variants))),
+                audit=args.audit,
+            )
+        elif args.intraday:
+            asyncio.run(run_intraday_stream(
+                interval=args.interval,
+                replay=args.replay,
+                record=args.record,
+                top_k=args.top_k,
+                rank_threshold=args.rank_threshold,
+            ))
         else:
             print("[*] 執行單次任務模式...")
-            asyncio.run(run_automation())
+            run_once(
+                f"morning_report {args.date or 'today'}",
+                lambda: asyncio.run(run_automation(target_date=args.date)),
+                audit=args.audit,
+            )
     except KeyboardInterrupt:
         print("\n[!] 程式已手動停止。 bye bye!")
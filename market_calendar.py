@@ -0,0 +1,94 @@
+import datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+# 美股交易所時區
+EXCHANGE_TZ = ZoneInfo("America/New_York")
+
+
+def easter_sunday(year: int) -> datetime.date:
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> datetime.date:
+    """n-th given weekday (Mon=0) of the month; n=-1 for the last one."""
+    if n > 0:
+        first = datetime.date(year, month, 1)
+        offset = (weekday - first.weekday()) % 7
+        return first + datetime.timedelta(days=offset + 7 * (n - 1))
+    next_month = datetime.date(year + month // 12, month % 12 + 1, 1)
+    last = next_month - datetime.timedelta(days=1)
+    return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(day: datetime.date) -> datetime.date:
+    """Saturday holidays are observed on Friday, Sunday holidays on Monday."""
+    if day.weekday() == 5:
+        return day - datetime.timedelta(days=1)
+    if day.weekday() == 6:
+        return day + datetime.timedelta(days=1)
+    return day
+
+
+@lru_cache(maxsize=None)
+def nyse_holidays(year: int) -> frozenset:
+    """
+    NYSE full-day closures for a year, computed offline from the exchange rules
+    (no API call). Special one-off closures (e.g. national days of mourning)
+    are not included.
+    """
+    holidays = set()
+
+    # New Year's Day: a Saturday holiday is NOT moved to the prior Friday
+    new_year = datetime.date(year, 1, 1)
+    if new_year.weekday() != 5:
+        holidays.add(_observed(new_year))
+
+    holidays.add(_nth_weekday(year, 1, 0, 3))                    # Martin Luther King Jr. Day
+    holidays.add(_nth_weekday(year, 2, 0, 3))                    # Washington's Birthday
+    holidays.add(easter_sunday(year) - datetime.timedelta(days=2))  # Good Friday
+    holidays.add(_nth_weekday(year, 5, 0, -1))                   # Memorial Day
+    if year >= 2022:
+        holidays.add(_observed(datetime.date(year, 6, 19)))      # Juneteenth
+    holidays.add(_observed(datetime.date(year, 7, 4)))           # Independence Day
+    holidays.add(_nth_weekday(year, 9, 0, 1))                    # Labor Day
+    holidays.add(_nth_weekday(year, 11, 3, 4))                   # Thanksgiving
+    holidays.add(_observed(datetime.date(year, 12, 25)))         # Christmas
+
+    return frozenset(d for d in holidays if d.year == year)
+
+
+def is_trading_day(day: datetime.date) -> bool:
+    return day.weekday() < 5 and day not in nyse_holidays(day.year)
+
+
+def session_date(moment: datetime.datetime) -> datetime.date:
+    """The exchange-local calendar date of an aware datetime."""
+    return moment.astimezone(EXCHANGE_TZ).date()
+
+
+def previous_trading_day(day: datetime.date) -> datetime.date:
+    """Most recent trading day strictly before `day`."""
+    day -= datetime.timedelta(days=1)
+    while not is_trading_day(day):
+        day -= datetime.timedelta(days=1)
+    return day
+
+
+def next_trading_day(day: datetime.date) -> datetime.date:
+    """First trading day strictly after `day`."""
+    day += datetime.timedelta(days=1)
+    while not is_trading_day(day):
+        day += datetime.timedelta(days=1)
+    return day
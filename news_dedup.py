@@ -0,0 +1,122 @@
+import re
+import time
+import zlib
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 指紋只取標題與內文開頭；轉載稿的差異通常在結尾 (免責聲明、相關連結)
+FINGERPRINT_CHARS = 2000
+SHINGLE_SIZE = 3
+# 64-bit SimHash 漢明距離 <= 3 視為近似重複；切成 4 段 16-bit，鴿籠原理保證至少一段完全相同
+MAX_HAMMING = 3
+BANDS = 4
+
+_WORD_RE = re.compile(r"\w+")
+_BIT_SHIFTS = np.arange(64, dtype=np.uint64)
+
+
+def _mix64(h: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer：讓組合後的雜湊位元分佈均勻
+    h = h ^ (h >> np.uint64(31))
+    h = h * np.uint64(0x7FB5D329728EA185)
+    h = h ^ (h >> np.uint64(27))
+    h = h * np.uint64(0x81DADEF4BC2DD44D)
+    return h ^ (h >> np.uint64(33))
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    """Unique 64-bit hashes of word 3-gram shingles (vectorized over the article)."""
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    word_hashes = _mix64(np.fromiter((zlib.crc32(w.encode()) for w in words), dtype=np.uint64, count=len(words)))
+    if len(words) < SHINGLE_SIZE:
+        return np.unique(word_hashes)
+    n = len(words) - SHINGLE_SIZE + 1
+    combined = word_hashes[:n].copy()
+    for offset in range(1, SHINGLE_SIZE):
+        combined = _mix64(combined ^ (word_hashes[offset:offset + n] + np.uint64(offset)))
+    return np.unique(combined)
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over word 3-gram shingles."""
+    hashes = _shingle_hashes(text)
+    if hashes.size == 0:
+        return 0
+    bits = (hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - hashes.size
+    return int(sum(1 << i for i in range(64) if votes[i] > 0))
+
+
+def _fingerprint(item: dict) -> int:
+    text = f"{item.get('title') or ''}\n{item.get('text') or ''}"
+    return simhash(text[:FINGERPRINT_CHARS])
+
+
+def _find(parent: list, i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def dedup_news(news_by_symbol: dict[str, list[dict]]) -> tuple[dict, dict]:
+    """
+    Collapse near-duplicate articles across symbols and days.
+
+    Each cluster of near-duplicates keeps only its most recent article (by
+    publishedDate), listed under that article's symbol. Other symbols in the
+    cluster lose the copy, unless that would leave them with no news at all,
+    in which case they share the representative.
+    :return: (deduplicated news_by_symbol, stats)
+    """
+    started = time.perf_counter()
+    flat = [(symbol, item) for symbol, items in news_by_symbol.items() for item in items]
+    fingerprints = [_fingerprint(item) for _, item in flat]
+
+    # LSH 分段找候選，再以漢明距離確認，union-find 合併成群
+    parent = list(range(len(flat)))
+    band_mask = (1 << (64 // BANDS)) - 1
+    buckets = {}
+    for i, fp in enumerate(fingerprints):
+        for band in range(BANDS):
+            key = (band, (fp >> (band * 64 // BANDS)) & band_mask)
+            for j in buckets.get(key, ()):
+                if (fp ^ fingerprints[j]).bit_count() <= MAX_HAMMING:
+                    parent[_find(parent, i)] = _find(parent, j)
+            buckets.setdefault(key, []).append(i)
+
+    clusters = {}
+    for i in range(len(flat)):
+        clusters.setdefault(_find(parent, i), []).append(i)
+
+    kept = set()
+    symbols_in_cluster = {}
+    for root, members in clusters.items():
+        representative = max(members, key=lambda i: flat[i][1].get('publishedDate') or "")
+        kept.add(representative)
+        symbols_in_cluster[representative] = {flat[i][0] for i in members}
+
+    result = {symbol: [] for symbol in news_by_symbol}
+    for i in sorted(kept):
+        symbol, item = flat[i]
+        result[symbol].append(item)
+    for i in sorted(kept):
+        for symbol in symbols_in_cluster[i]:
+            if not result[symbol]:
+                result[symbol].append(flat[i][1])
+
+    kept_ids = {id(item) for items in result.values() for item in items}
+    removed = [item for _, item in flat if id(item) not in kept_ids]
+    stats = {
+        'articles_in': len(flat),
+        'articles_out': sum(len(items) for items in result.values()),
+        'clusters': len(clusters),
+        'removed': len(removed),
+        'chars_removed': sum(len(item.get('title') or '') + len(item.get('text') or '') for item in removed),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+    return result, stats
@@ -0,0 +1,98 @@
+import re
+import json
+
+# 各欄位字元預算 (超過即截斷)，控制每個階段的 prompt 大小
+FIELD_BUDGETS = {
+    'news_title': 200,
+    'news_text': 1500,
+    'news_total': 8000,
+    'recap_content': 20000,
+    'recap_summary': 400,
+    'symbol_summary': 300,
+}
+
+# 已翻譯的 snapshot：摘要在翻譯前已以原文預算截斷，翻譯後的長度因語言而異，不再截斷
+TRANSLATED_BUDGETS = {**FIELD_BUDGETS, 'recap_summary': None, 'symbol_summary': None}
+
+_CJK_RE = re.compile(r"[　-ヿ㐀-䶿一-鿿豈-﫿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate: ~1 token per CJK character, ~4 characters per token otherwise."""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate(text, max_chars: int) -> str:
+    text = "" if text is None else str(text)
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars - 1] + "…"
+
+
+def compact_json(obj) -> str:
+    """Minified JSON (no indentation, no spaces after separators, UTF-8 kept)."""
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _cell(value, budget=None) -> str:
+    text = "" if value is None else str(value)
+    text = text.replace("\n", " ").replace("|", "/")
+    return truncate(text, budget) if budget else text
+
+
+def to_table(rows: list[dict], fields: list[str], budgets: dict = None) -> str:
+    """
+    Pipe-separated table with a single header line; far fewer tokens than a list
+    of JSON objects because keys are written once.
+    :param budgets: optional per-field max characters
+    """
+    if not rows:
+        return "N/A"
+    budgets = budgets or {}
+    lines = ["|".join(fields)]
+    for row in rows:
+        lines.append("|".join(_cell(row.get(f), budgets.get(f)) for f in fields))
+    return "\n".join(lines)
+
+
+def format_news_items(news_items: list[dict], budgets: dict = FIELD_BUDGETS) -> str:
+    """Join news articles under per-article and total character budgets."""
+    parts = []
+    used = 0
+    for item in news_items:
+        title = truncate(item.get('title') or 'No Title', budgets['news_title'])
+        text = truncate(item.get('text') or 'No Content', budgets['news_text'])
+        part = f"Title: {title}\nContent: {text}\n---\n"
+        if used + len(part) > budgets['news_total']:
+            break
+        parts.append(part)
+        used += len(part)
+    return "".join(parts)
+
+
+def format_market_payload(snapshot, budgets: dict = FIELD_BUDGETS) -> dict:
+    """
+    Serialize a MarketSnapshot into compact prompt blocks:
+    treasury / recap / movers / news summaries as pipe tables.
+    """
+    treasury_rows = [
+        {'tenor': t.tenor, 'current': t.current, 'prev': t.prev, '5d': t.d5, 'lm': t.lm}
+        for t in snapshot.treasury
+    ]
+    recap_rows = [{'topic': r.topic, 'summary': r.summary} for r in snapshot.recap]
+    movers_rows = [
+        {'symbol': m.symbol, 'changesPercentage': m.change, 'price': m.price, 'type': m.kind}
+        for m in snapshot.movers
+    ]
+    news_rows = [{'symbol': n.symbol, 'summary': n.summary} for n in snapshot.news]
+
+    return {
+        'market_data_str': snapshot.market_data_str or 'N/A',
+        'treasury': to_table(treasury_rows, ['tenor', 'current', 'prev', '5d', 'lm']),
+        'recap': to_table(recap_rows, ['topic', 'summary'], {'summary': budgets['recap_summary']}),
+        'movers': to_table(movers_rows, ['symbol', 'changesPercentage', 'price', 'type']),
+        'news': to_table(news_rows, ['symbol', 'summary'], {'summary': budgets['symbol_summary']}),
+    }
@@ -0,0 +1,188 @@
+import os
+import gc
+import json
+import time
+import logging
+import tracemalloc
+from collections import deque
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_PROC = Path("/proc")
+
+
+def rss_bytes() -> int:
+    """Current resident set size (falls back to peak RSS where /proc is unavailable)."""
+    try:
+        pages = int((_PROC / "self/statm").read_text().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def open_fd_count():
+    try:
+        return len(os.listdir(_PROC / "self/fd"))
+    except OSError:
+        return None
+
+
+def child_pids() -> list[int]:
+    """PIDs whose parent is this process (e.g. leftover Chromium / Playwright driver)."""
+    pid = str(os.getpid())
+    children = []
+    try:
+        entries = list(_PROC.iterdir())
+    except OSError:
+        return children
+    for entry in entries:
+        if not entry.name.isdigit():
+            continue
+        try:
+            # 第 4 欄為 ppid；程式名稱可能含空白，因此從最後一個 ')' 之後切分
+            stat = (entry / "stat").read_text()
+            if stat[stat.rindex(")") + 2:].split()[1] == pid:
+                children.append(int(entry.name))
+        except (OSError, ValueError, IndexError):
+            continue
+    return children
+
+
+def _usage() -> dict:
+    return {'rss': rss_bytes(), 'fds': open_fd_count(), 'children': child_pids()}
+
+
+class ResourceAudit:
+    """
+    Records RSS, open file descriptors, child processes and the tracemalloc
+    allocations retained by one pipeline run (after gc), and warns when the run
+    leaves more behind than the thresholds allow. Usable with `with` or
+    `async with`; the result is in `.report` and appended to `history`
+    (last 100 runs).
+    """
+
+    history = deque(maxlen=100)
+
+    def __init__(self, label: str, top: int = 10, frames: int = 1,
+                 rss_limit: int = 50 * 1024 * 1024, fd_limit: int = 10):
+        self.label = label
+        self.top = top
+        self.frames = frames
+        self.rss_limit = rss_limit
+        self.fd_limit = fd_limit
+        self.report = None
+        self._started_tracing = False
+
+    def __enter__(self):
+        gc.collect()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        self._before = _usage()
+        self._snapshot = tracemalloc.take_snapshot()
+        self._started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        gc.collect()
+        after = _usage()
+        snapshot = tracemalloc.take_snapshot()
+        if self._started_tracing:
+            tracemalloc.stop()
+
+        stats = snapshot.compare_to(self._snapshot, 'lineno')
+        retained = sorted((s for s in stats if s.size_diff > 0), key=lambda s: s.size_diff, reverse=True)
+        before = self._before
+        self.report = {
+            'label': self.label,
+            'seconds': round(time.monotonic() - self._started, 1),
+            'rss_before': before['rss'],
+            'rss_after': after['rss'],
+            'rss_delta': after['rss'] - before['rss'],
+            'fds_before': before['fds'],
+            'fds_after': after['fds'],
+            'new_children': sorted(set(after['children']) - set(before['children'])),
+            'top_allocations': [
+                {'where': str(s.traceback), 'size_diff': s.size_diff, 'count_diff': s.count_diff}
+                for s in retained[:self.top]
+            ],
+        }
+        ResourceAudit.history.append(self.report)
+        self._print()
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc_info):
+        return self.__exit__(*exc_info)
+
+    def _print(self):
+        r = self.report
+        fd_delta = (r['fds_after'] - r['fds_before']) if r['fds_after'] is not None else None
+        print(
+            f"[🔎] 資源稽核 {r['label']}: RSS {r['rss_before'] / 2**20:.1f} → {r['rss_after'] / 2**20:.1f} MiB, "
+            f"FD {r['fds_before']} → {r['fds_after']}, 新增子程序 {len(r['new_children'])}"
+        )
+        for alloc in r['top_allocations'][:3]:
+            print(f"      +{alloc['size_diff'] / 1024:.1f} KiB ({alloc['count_diff']:+d}) {alloc['where']}")
+        if r['rss_delta'] > self.rss_limit:
+            print(f"   [!] RSS 增加 {r['rss_delta'] / 2**20:.1f} MiB，超過門檻 {self.rss_limit / 2**20:.0f} MiB")
+        if fd_delta is not None and fd_delta > self.fd_limit:
+            print(f"   [!] 檔案描述符增加 {fd_delta}，超過門檻 {self.fd_limit}")
+        if r['new_children']:
+            print(f"   [!] 執行結束後仍有子程序存活: {r['new_children']}")
+
+
+# 子程序以此前綴在 stdout 輸出一行 JSON 稽核結果，由父程序解析
+REPORT_LINE_PREFIX = "[resource-audit] "
+
+
+def format_report_line(report: dict) -> str:
+    return REPORT_LINE_PREFIX + json.dumps(report, ensure_ascii=False)
+
+
+def parse_report_line(line: str):
+    """The audit report carried by a child's stdout line, or None for any other line."""
+    if not line.startswith(REPORT_LINE_PREFIX):
+        return None
+    try:
+        return json.loads(line[len(REPORT_LINE_PREFIX):])
+    except ValueError:
+        logger.warning(f"Malformed resource audit line: {line!r}")
+        return None
+
+
+def leak_trend(history: list[dict]) -> dict:
+    """
+    Least-squares growth per run of RSS and fd count over `history`, ignoring the
+    first run (imports and caches warm up there); at least 3 runs are needed for
+    a non-zero trend.
+    """
+    history = list(history)
+    runs = history[1:]
+
+    def slope(values):
+        n = len(values)
+        if n < 2:
+            return 0.0
+        mean_x, mean_y = (n - 1) / 2, sum(values) / n
+        numerator = sum((i - mean_x) * (v - mean_y) for i, v in enumerate(values))
+        return numerator / sum((i - mean_x) ** 2 for i in range(n))
+
+    fds = [r['fds_after'] for r in runs if r['fds_after'] is not None]
+    return {
+        'runs': len(history),
+        'rss_per_run': slope([r['rss_after'] for r in runs]),
+        'fds_per_run': slope(fds) if len(fds) == len(runs) else None,
+        'leftover_children': sum(len(r['new_children']) for r in history),
+    }
@@ -0,0 +1,245 @@
+import json
+import zlib
+import struct
+import datetime
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Optional
+
+# 檔案格式: MAGIC + 版本 (uint16, big-endian) + zlib 壓縮的欄式 (columnar) JSON
+MAGIC = b"MKSNAP"
+# v2: NewsSummary.news_hash 與 MarketSnapshot.recap_hash (增量模式用來判斷摘要是否可沿用)；v1 檔案仍可讀取
+SNAPSHOT_VERSION = 2
+_HEADER = struct.Struct(">6sH")
+
+
+@dataclass(frozen=True, slots=True)
+class Quote:
+    """Index, commodity or sector ETF quote; price/change are None when the fetch failed."""
+    name: str
+    symbol: str
+    price: Optional[float]
+    change: Optional[float]
+
+
+@dataclass(frozen=True, slots=True)
+class TreasuryRate:
+    tenor: str
+    current: Optional[float]
+    prev: Optional[float]
+    d5: Optional[float]
+    lm: Optional[float]
+
+
+@dataclass(frozen=True, slots=True)
+class Mover:
+    symbol: str
+    change: float
+    price: Optional[float]
+    kind: str  # 'Top Gainer' / 'Top Loser'
+
+
+@dataclass(frozen=True, slots=True)
+class NewsSummary:
+    symbol: str
+    summary: str
+    news_hash: str = ""  # 摘要所依據的新聞集合指紋；空字串表示不可沿用 (例如摘要失敗)
+
+
+@dataclass(frozen=True, slots=True)
+class RecapItem:
+    topic: str
+    summary: str
+
+
+_TABLES = {
+    'indices': Quote,
+    'sectors': Quote,
+    'treasury': TreasuryRate,
+    'movers': Mover,
+    'news': NewsSummary,
+    'recap': RecapItem,
+}
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        result = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if result != result else result  # NaN -> None
+
+
+@dataclass(frozen=True, slots=True)
+class MarketSnapshot:
+    """
+    Immutable, typed record of everything one report is built from. It is the
+    single input to the renderers and LLM prompts, and is archived per date.
+    """
+    date: str  # YYYY-MM-DD (report date)
+    indices: tuple = ()
+    sectors: tuple = ()
+    treasury: tuple = ()
+    movers: tuple = ()
+    news: tuple = ()
+    recap: tuple = ()
+    recap_hash: str = ""  # 市場回顧原文的雜湊
+
+    # ---------- construction from the raw client outputs ----------
+
+    @staticmethod
+    def treasury_from_dict(treasury_result: dict) -> tuple:
+        return tuple(
+            TreasuryRate(
+                tenor=tenor,
+                current=_to_float(values.get('current')),
+                prev=_to_float(values.get('prev')),
+                d5=_to_float(values.get('5d')),
+                lm=_to_float(values.get('lm')),
+            )
+            for tenor, values in (treasury_result or {}).items()
+        )
+
+    @staticmethod
+    def movers_from_list(items: list[dict]) -> tuple:
+        return tuple(
+            Mover(symbol=i['symbol'], change=float(i['changesPercentage']), price=_to_float(i.get('price')), kind=i.get('type', ''))
+            for i in items or []
+        )
+
+    @staticmethod
+    def news_from_dict(summaries: dict, news_hashes: dict = None) -> tuple:
+        news_hashes = news_hashes or {}
+        return tuple(
+            NewsSummary(symbol=s, summary=text, news_hash=news_hashes.get(s, ""))
+            for s, text in (summaries or {}).items()
+        )
+
+    @staticmethod
+    def recap_from_list(items: list[dict]) -> tuple:
+        return tuple(
+            RecapItem(topic=str(i.get('topic', '')), summary=str(i.get('summary', '')))
+            for i in items or [] if isinstance(i, dict)
+        )
+
+    # ---------- views ----------
+
+    def selected_sectors(self) -> list:
+        """All sectors if there are at most 6, otherwise the first 3 gainers and first 3 decliners of the ranking."""
+        ranked = sorted((s for s in self.sectors if s.change is not None), key=lambda s: s.change, reverse=True)
+        if len(ranked) <= 6:
+            return ranked
+        top_3 = [s for s in ranked if s.change > 0][:3]
+        bottom_3 = [s for s in ranked if s.change < 0][:3]
+        return top_3 + bottom_3
+
+    @property
+    def market_data_str(self) -> str:
+        lines = []
+        for q in self.indices:
+            lines.append(f"{q.name}: Price {q.price}, Change {q.change}%" if q.price is not None else f"{q.name}: N/A")
+        for s in self.selected_sectors():
+            lines.append(f"{s.name}: Price {s.price}, Change {s.change}%")
+        return "\n".join(lines)
+
+    # ---------- persistence ----------
+
+    def to_bytes(self) -> bytes:
+        columns = {'date': self.date, 'recap_hash': self.recap_hash}
+        for table, row_type in _TABLES.items():
+            rows = getattr(self, table)
+            columns[table] = {f.name: [getattr(r, f.name) for r in rows] for f in fields(row_type)}
+        payload = zlib.compress(json.dumps(columns, separators=(",", ":"), ensure_ascii=False).encode("utf-8"), 6)
+        return _HEADER.pack(MAGIC, SNAPSHOT_VERSION) + payload
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "MarketSnapshot":
+        magic, version = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a market snapshot file")
+        if version > SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot version {version} is newer than supported ({SNAPSHOT_VERSION})")
+        columns = json.loads(zlib.decompress(data[_HEADER.size:]).decode("utf-8"))
+        tables = {}
+        for table, row_type in _TABLES.items():
+            cols = columns.get(table) or {}
+            # 舊版檔案缺少的欄位 (皆有預設值) 由 dataclass 預設值補上
+            names = [f.name for f in fields(row_type) if f.name in cols]
+            tables[table] = tuple(row_type(**dict(zip(names, values))) for values in zip(*(cols[n] for n in names)))
+        return cls(date=columns['date'], recap_hash=columns.get('recap_hash', ""), **tables)
+
+    def save(self, path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(self.to_bytes())
+        tmp_path.replace(path)
+        return path
+
+    @classmethod
+    def load(cls, path) -> "MarketSnapshot":
+        return cls.from_bytes(Path(path).read_bytes())
+
+    # ---------- comparison ----------
+
+    def diff(self, previous: "MarketSnapshot") -> dict:
+        """Day-over-day changes computed directly from the stored numbers."""
+        def by_symbol(rows):
+            return {r.symbol: r for r in rows}
+
+        def quote_moves(today, before):
+            old = by_symbol(before)
+            return {
+                q.symbol: round(q.price - old[q.symbol].price, 4)
+                for q in today
+                if q.symbol in old and q.price is not None and old[q.symbol].price is not None
+            }
+
+        old_treasury = {t.tenor: t for t in previous.treasury}
+        today_movers, old_movers = set(by_symbol(self.movers)), set(by_symbol(previous.movers))
+        old_news = {n.symbol: n.summary for n in previous.news}
+        return {
+            'previous_date': previous.date,
+            'indices': quote_moves(self.indices, previous.indices),
+            'sectors': quote_moves(self.sectors, previous.sectors),
+            'treasury': {
+                t.tenor: round(t.current - old_treasury[t.tenor].current, 4)
+                for t in self.treasury
+                if t.tenor in old_treasury and t.current is not None and old_treasury[t.tenor].current is not None
+            },
+            'movers_added': sorted(today_movers - old_movers),
+            'movers_removed': sorted(old_movers - today_movers),
+            'news_changed': sorted(n.symbol for n in self.news if old_news.get(n.symbol) != n.summary),
+            'recap_changed': self.recap != previous.recap,
+        }
+
+
+class SnapshotArchive:
+    """One snapshot file per report date (YYYY-MM-DD.snap) under `root`."""
+
+    SUFFIX = ".snap"
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path_for(self, date: str) -> Path:
+        return self.root / f"{date}{self.SUFFIX}"
+
+    def save(self, snapshot: MarketSnapshot) -> Path:
+        return snapshot.save(self.path_for(snapshot.date))
+
+    def load(self, date: str) -> Optional[MarketSnapshot]:
+        path = self.path_for(date)
+        return MarketSnapshot.load(path) if path.exists() else None
+
+    def previous(self, date: str) -> Optional[MarketSnapshot]:
+        """Most recent archived snapshot strictly before `date`."""
+        if not self.root.exists():
+            return None
+        earlier = sorted(p.stem for p in self.root.glob(f"*{self.SUFFIX}") if p.stem < date)
+        return self.load(earlier[-1]) if earlier else None
+
+
+def report_date_iso(target_date: str) -> str:
+    """'2025 / 12 / 01' -> '2025-12-01'"""
+    return datetime.datetime.strptime(target_date.replace(" ", ""), "%Y/%m/%d").date().isoformat()
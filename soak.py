@@ -0,0 +1,147 @@
+"""
+Soak test: run the full pipeline many times back to back against local fakes
+(FMP, Gemini, market recap, Telegram, Ghost) and report resource growth per run.
+
+    python soak.py --iterations 50
+    python soak.py --iterations 50 --isolate       # each run in a fresh subprocess
+    python soak.py --iterations 200 --fake-render  # skip Chromium as well
+"""
+import os
+import sys
+import asyncio
+import argparse
+import tempfile
+import functools
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# main.py 在匯入時即建立 API Client，需先提供假金鑰
+for _name in ("FMP_API_KEY", "GEMINI_API_KEY"):
+    os.environ.setdefault(_name, "fake")
+
+import httpx
+
+import main
+import generate
+from fakes import FakeBot, FakeFMPClient, FakeGenaiClient, FakeGhostAdminAPI, fake_market_recap_content
+from ghost_client import AsyncGhostClient
+from llm_hedge import LatencyStats
+from resource_guard import ResourceAudit, format_report_line, leak_trend, parse_report_line
+from incremental import RenderCache
+from snapshot import SnapshotArchive
+
+FAKE_GHOST_KEY = "fakeid:" + "00" * 32
+
+# 1x1 透明 PNG
+_PLACEHOLDER_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+
+async def _fake_convert_to_images(html_file_path, page=None, browser=None):
+    paths = []
+    for part in (1, 2):
+        path = html_file_path.with_name(f"{html_file_path.stem}_part{part}.png")
+        path.write_bytes(_PLACEHOLDER_PNG)
+        paths.append(path)
+    return paths
+
+
+def install_fakes(fake_render: bool = False, llm_latency: float = 0):
+    """Point every external dependency of main.run_automation at an in-process fake."""
+    main.fmp_client = FakeFMPClient()
+    main.get_market_recap_content = fake_market_recap_content
+    main.Bot = FakeBot
+    main.TELEGRAM_BOT_TOKEN = "fake:token"
+    main.TELEGRAM_CHAT_ID = "0"
+    main.PUBLISH_RETRY_DELAY = 0
+    generate.client = FakeGenaiClient(latency=llm_latency)
+    # 不寫入真實的延遲統計檔與 snapshot 存檔
+    generate.LATENCY_STATS = LatencyStats()
+    main.snapshot_archive = SnapshotArchive(tempfile.mkdtemp(prefix="soak-archive-"))
+    main.render_cache = RenderCache(tempfile.mkdtemp(prefix="soak-render-"))
+
+    os.environ["API_URL"] = "https://ghost.local"
+    os.environ["ADMIN_API"] = FAKE_GHOST_KEY
+    transport = httpx.MockTransport(FakeGhostAdminAPI(FAKE_GHOST_KEY))
+    main.AsyncGhostClient = functools.partial(AsyncGhostClient, transport=transport)
+
+    if fake_render:
+        main.convert_to_images = _fake_convert_to_images
+
+
+async def _run_child(fake_render: bool, incremental: bool):
+    """Run one iteration in a fresh process; returns (exit code, the child's own audit report)."""
+    args = [sys.executable, str(BASE_DIR / "soak.py"), "--iterations", "1", "--audit"]
+    if fake_render:
+        args.append("--fake-render")
+    if incremental:
+        args.append("--incremental")
+    env = {**os.environ, "PYTHONUNBUFFERED": "1"}
+    process = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, env=env)
+    report = None
+    async for raw in process.stdout:
+        line = raw.decode("utf-8", errors="replace")
+        parsed = parse_report_line(line.rstrip("\n"))
+        if parsed is None:
+            sys.stdout.write(line)
+        else:
+            report = parsed
+    return await process.wait(), report
+
+
+async def run_soak(iterations: int, fake_render: bool = False, isolate: bool = False, incremental: bool = False,
+                   report: bool = True) -> dict:
+    if not isolate:
+        install_fakes(fake_render=fake_render)
+
+    failures = 0
+    for i in range(1, iterations + 1):
+        print(f"\n======== [Soak {i}/{iterations}] ========")
+        if isolate:
+            # 稽核在子程序內進行 (父程序只是等待)，結果由子程序以 JSON 行回報
+            returncode, audit = await _run_child(fake_render, incremental)
+            failures += returncode != 0
+            if audit is not None:
+                ResourceAudit.history.append({**audit, 'label': f"soak-{i}"})
+            continue
+        with ResourceAudit(f"soak-{i}"):
+            failures += not await main.run_automation(target_date="2026 / 01 / 02", incremental=incremental)
+
+    trend = leak_trend(ResourceAudit.history)
+    trend['failures'] = failures
+    if not report:
+        return trend
+    if len(ResourceAudit.history) < 3:
+        print("\n[!] 少於 3 次執行 (第 1 次為暖機、不列入)，無法估計資源成長趨勢")
+    print(
+        f"\n[🔎] Soak 結果: {trend['runs']} 次，RSS 每次 {trend['rss_per_run'] / 1024:+.1f} KiB，"
+        f"FD 每次 {trend['fds_per_run'] if trend['fds_per_run'] is None else round(trend['fds_per_run'], 2)}，"
+        f"殘留子程序 {trend['leftover_children']}，執行失敗 {failures}"
+    )
+    return trend
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline soak test against local fakes")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--isolate", action="store_true", help="每次執行於獨立子程序")
+    parser.add_argument("--fake-render", action="store_true", help="以佔位圖片取代 Playwright 截圖")
+    parser.add_argument("--incremental", action="store_true", help="以增量模式執行 (第二次起沿用摘要與 HTML 區塊)")
+    parser.add_argument("--audit", action="store_true", help="結束時以 JSON 行輸出最後一次的資源稽核 (供 --isolate 的父程序讀取)")
+    parser.add_argument("--max-rss-growth-kib", type=float, default=512, help="每次執行允許的 RSS 成長 (KiB)")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_soak(args.iterations, fake_render=args.fake_render, isolate=args.isolate,
+                                  incremental=args.incremental, report=not args.audit))
+    if args.audit and ResourceAudit.history:
+        print(format_report_line(ResourceAudit.history[-1]), flush=True)
+    leaked = (
+        result['rss_per_run'] / 1024 > args.max_rss_growth_kib
+        or (result['fds_per_run'] or 0) > 0.5
+        or result['leftover_children']
+        or result['failures']
+    )
+    sys.exit(1 if leaked else 0)
@@ -0,0 +1,161 @@
+import json
+import asyncio
+import logging
+import dataclasses
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from generate import translate_texts
+from incremental import content_hash
+from prompt_payload import FIELD_BUDGETS, truncate
+from snapshot import MarketSnapshot, RecapItem
+
+logger = logging.getLogger(__name__)
+
+# 摘要與預設 prompt 的原始語言；其他語言的版本需要翻譯
+SOURCE_LANGUAGE = "繁體中文"
+UNIVERSES = ("sp500",)
+
+
+@dataclass(frozen=True)
+class ReportVariant:
+    """
+    One client-facing version of the daily report. Variants that share a
+    universe share a single data collection pass.
+    """
+    name: str
+    chat_id: str
+    watchlist: tuple = ()  # 空 = 整個 universe；否則只在這些股票中挑選最大漲跌個股
+    language: str = SOURCE_LANGUAGE
+    universe: str = "sp500"
+    movers: int = 6  # 漲/跌各取幾檔
+    template: str = "prompts/tg_template.html"
+    prompt: Optional[str] = None  # 自訂 prompt 檔 (可用 {target_date} {language} {market_data_str} {treasury} {recap} {movers} {news} {html_template})
+
+    @property
+    def render_profile(self) -> str:
+        """Hash of the settings that shape this variant's report; variants with equal profiles share a render cache entry."""
+        return content_hash(self.template, self.prompt, self.language, sorted(self.watchlist), self.movers)
+
+
+def load_variants(path) -> list[ReportVariant]:
+    """
+    Read variants from a JSON file: {"variants": [{"name": ..., "chat_id": ..., ...}]}
+    (a bare list is accepted too).
+    """
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    items = data.get('variants', []) if isinstance(data, dict) else data
+    variants = []
+    for item in items:
+        item = dict(item)
+        item['watchlist'] = tuple(s.upper() for s in item.get('watchlist') or ())
+        item['chat_id'] = str(item['chat_id'])
+        variant = ReportVariant(**item)
+        if variant.universe not in UNIVERSES:
+            raise ValueError(f"{variant.name}: unknown universe {variant.universe!r} (available: {UNIVERSES})")
+        variants.append(variant)
+    names = [v.name for v in variants]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate variant names in {path}")
+    return variants
+
+
+def filter_quotes(quotes: list[dict], watchlist) -> list[dict]:
+    if not watchlist:
+        return quotes
+    allowed = set(watchlist)
+    return [q for q in quotes if q.get('symbol') in allowed]
+
+
+def fill_prompt(text: str, values: dict) -> str:
+    """Replace {name} placeholders; other braces in the prompt are left untouched."""
+    for key, value in values.items():
+        text = text.replace("{" + key + "}", str(value))
+    return text
+
+
+def variant_snapshot(shared: MarketSnapshot, movers: tuple) -> MarketSnapshot:
+    """The shared snapshot narrowed to one variant's movers and their news summaries."""
+    symbols = {m.symbol for m in movers}
+    return dataclasses.replace(shared, movers=movers, news=tuple(n for n in shared.news if n.symbol in symbols))
+
+
+class Translator:
+    """
+    Memoized translations keyed by (language, text hash). Variants that need the
+    same text in the same language share one LLM call, even when they ask
+    concurrently. A failed batch falls back to the source text.
+    """
+
+    def __init__(self, source_language: str = SOURCE_LANGUAGE):
+        self.source_language = source_language
+        self._results = {}
+        self.calls = 0
+        self.translated = 0
+        self.reused = 0
+
+    async def translate(self, texts: list[str], language: str) -> list[str]:
+        if language == self.source_language or not texts:
+            return list(texts)
+        loop = asyncio.get_running_loop()
+        futures, missing = {}, []
+        for text in dict.fromkeys(texts):
+            key = (language, content_hash(text))
+            if key in self._results:
+                self.reused += 1
+            else:
+                self._results[key] = loop.create_future()
+                missing.append(text)
+            futures[text] = self._results[key]
+
+        if missing:
+            self.calls += 1
+            self.translated += len(missing)
+            try:
+                results = await asyncio.to_thread(translate_texts, missing, language)
+            except Exception as e:
+                print(f"   [!] 翻譯成 {language} 失敗，沿用原文: {e}")
+                # 失敗的結果不保留，下次仍會重新翻譯
+                for text in missing:
+                    del self._results[(language, content_hash(text))]
+                results = missing
+            for text, result in zip(missing, results):
+                futures[text].set_result(result)
+
+        return [await futures[text] for text in texts]
+
+    async def translate_snapshot(self, snapshot: MarketSnapshot, language: str) -> MarketSnapshot:
+        """
+        Translate the generated prose (news summaries and recap) of a snapshot.
+        Summaries are cut to their FIELD_BUDGETS before translating, so the translated
+        text can be formatted with TRANSLATED_BUDGETS without being cut again.
+        """
+        if language == self.source_language:
+            return snapshot
+        texts = [truncate(n.summary, FIELD_BUDGETS['symbol_summary']) for n in snapshot.news]
+        for r in snapshot.recap:
+            texts += [r.topic, truncate(r.summary, FIELD_BUDGETS['recap_summary'])]
+        translated = iter(await self.translate(texts, language))
+        news = tuple(dataclasses.replace(n, summary=next(translated)) for n in snapshot.news)
+        recap = tuple(RecapItem(topic=next(translated), summary=next(translated)) for _ in snapshot.recap)
+        return dataclasses.replace(snapshot, news=news, recap=recap)
+
+
+class SharedTasks:
+    """Runs each distinct key's coroutine once; later callers await the same task."""
+
+    def __init__(self):
+        self._tasks = {}
+        self.hits = 0
+
+    def run(self, key, factory):
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(factory())
+        else:
+            self.hits += 1
+        return task
+
+    def __len__(self):
+        return len(self._tasks)
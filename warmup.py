@@ -0,0 +1,103 @@
+import time
+import logging
+from playwright.async_api import async_playwright
+from telegram import Bot
+
+logger = logging.getLogger(__name__)
+
+
+class WarmContext:
+    """
+    Resources opened ahead of a scheduled run so the timed run starts hot.
+    Every attribute may be None if its warm-up step failed; callers fall back
+    to the cold path in that case.
+    """
+
+    def __init__(self):
+        self.bot = None
+        self.browser = None
+        self.page = None
+        self.quota = {}
+        self.warmed_at = None
+        self._playwright = None
+
+    async def close(self):
+        """Release the browser and the Telegram connection pool."""
+        await self.close_browser()
+        if self.bot is not None:
+            try:
+                await self.bot.shutdown()
+            except Exception as e:
+                logger.warning(f"Error shutting down Telegram bot: {e}")
+        self.bot = None
+
+    async def close_browser(self):
+        if self.browser is not None:
+            try:
+                await self.browser.close()
+            except Exception as e:
+                logger.warning(f"Error closing warm browser: {e}")
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception as e:
+                logger.warning(f"Error stopping playwright: {e}")
+        self.browser = None
+        self.page = None
+        self._playwright = None
+
+
+async def warm_up(fmp_client, genai_client, model_name, telegram_token=None, page_url=None, preload=()):
+    """
+    Preload static inputs, open pooled connections (FMP / Gemini / Telegram),
+    launch a browser page pre-navigated to the template and check quota headroom.
+    :param preload: zero-argument callables whose results are cached by the callee
+                    (e.g. the constituent universe or template readers)
+    :param page_url: file:// URL of the HTML template used to warm the browser cache
+    """
+    ctx = WarmContext()
+    started = time.monotonic()
+
+    for load in preload:
+        try:
+            load()
+        except Exception as e:
+            print(f"   [!] 預載失敗 {getattr(load, '__name__', load)}: {e}")
+
+    # FMP: 開啟連線並檢查配額
+    ctx.quota['fmp'] = fmp_client.probe()
+    if not ctx.quota['fmp']['ok']:
+        print(f"   [!] FMP 探測異常: {ctx.quota['fmp']}")
+
+    # Gemini: count_tokens 不計入生成配額，但會建立連線並驗證金鑰/配額
+    try:
+        genai_client.models.count_tokens(model=model_name, contents="ping")
+        ctx.quota['gemini'] = {'ok': True}
+    except Exception as e:
+        ctx.quota['gemini'] = {'ok': False, 'error': str(e)}
+        print(f"   [!] Gemini 探測異常: {e}")
+
+    # Telegram: initialize() 會呼叫 getMe 並保持連線池
+    if telegram_token:
+        try:
+            bot = Bot(token=telegram_token)
+            await bot.initialize()
+            ctx.bot = bot
+        except Exception as e:
+            print(f"   [!] Telegram 預熱失敗: {e}")
+
+    # Browser: 啟動 Chromium 並預先載入版型 (字型/CSS 會被快取)
+    if page_url:
+        try:
+            ctx._playwright = await async_playwright().start()
+            ctx.browser = await ctx._playwright.chromium.launch()
+            ctx.page = await ctx.browser.new_page(device_scale_factor=3)
+            await ctx.page.set_viewport_size({"width": 1000, "height": 2000})
+            await ctx.page.goto(page_url, wait_until="networkidle", timeout=120000)
+        except Exception as e:
+            print(f"   [!] 瀏覽器預熱失敗: {e}")
+            await ctx.close_browser()
+
+    ctx.warmed_at = time.monotonic()
+    print(f"[+] 預熱完成，耗時 {ctx.warmed_at - started:.1f} 秒 (配額: {ctx.quota})")
+    return ctx